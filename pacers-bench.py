@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+################################################################################
+# pacers-bench.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+'''
+pacers-bench.py
+    : PACERs script for benchmarking PACERs itself with a synthetic assignment
+
+Usage example:
+    ./pacers-bench.py --num-students 50 --types single:4 cmake:1 zip:1 --behaviors fast:8 timeout:1 flood:1
+    ./pacers-bench.py --micro
+
+Please see https://github.com/yssl/PACERs for more information.
+'''
+
+import os, sys, argparse, datetime
+import multiprocessing as mp
+
+from pacerslib.global_const import *
+from pacerslib.unicode import *
+from pacerslib.bench import *
+from pacerslib.microbench import *
+
+# ['name:weight', ...] -> {name:weight, ...}
+def parseWeights(weightStrs, names):
+    weights = {}
+    for weightStr in weightStrs:
+        name, sep, weight = weightStr.partition(':')
+        if name not in names:
+            raise argparse.ArgumentTypeError('unknown name %s (choose from %s)'%(name, ', '.join(names)))
+        try:
+            weights[name] = float(weight) if sep!='' else 1.
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid weight %s'%weightStr)
+    return weights
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(prog='pacers-bench.py', formatter_class=argparse.RawTextHelpFormatter,
+            description='''pacers-bench.py
+    : PACERs script for benchmarking PACERs itself with a synthetic assignment''')
+    parser.add_argument('--num-students', default=30, type=int,
+                        help='''Number of submissions in the synthetic assignment.
+default: 30''')
+    parser.add_argument('--types', nargs='+', default=['single:4', 'files:2', 'cmake:1', 'zip:1', 'unicode:1'],
+                        help='''Mix of submission types as NAME:WEIGHT.
+single - a single source file
+files - a directory with two source files
+cmake - a directory with CMakeLists.txt
+zip - a zip file of a directory with a source file
+unicode - a single source file with a hangul name
+          and contents in utf-8 or cp949
+default: single:4 files:2 cmake:1 zip:1 unicode:1''')
+    parser.add_argument('--behaviors', nargs='+', default=['fast:8', 'timeout:1', 'flood:1'],
+                        help='''Mix of program behaviors as NAME:WEIGHT.
+fast - reads two integers and prints their sum
+timeout - runs forever without output
+flood - prints lines forever
+default: fast:8 timeout:1 flood:1''')
+    parser.add_argument('--source-lines', default=200, type=int,
+                        help='''Approximate number of lines of each source file.
+default: 200''')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='''Random seed for generating the synthetic assignment.
+The same parameters and seed always generate
+the same assignment.
+default: 0''')
+    parser.add_argument('--repeat', default=3, type=int,
+                        help='''Number of repeats of each scenario. Medians of
+the repeats are used for the summary and comparison.
+default: 3''')
+    parser.add_argument('--timeout', default=1., type=float,
+                        help='''--timeout of pacers.py.
+default: 1''')
+    parser.add_argument('--num-cores', default=mp.cpu_count(), type=int,
+                        help='''--num-cores of pacers.py.
+default: number of cpu cores in your machine.''')
+    parser.add_argument('--pacers-args', nargs=argparse.REMAINDER, default=[],
+                        help='''Additional arguments of pacers.py.
+All arguments after --pacers-args are passed to pacers.py,
+so this option should be the last one.''')
+    parser.add_argument('--micro', action='store_true',
+                        help='''When specified, microbenchmarks of hot helper functions
+(opjoin, toUnicode, unico2decoPath,
+collectAllProjInfosInAllSubmissions, getSourcesTable)
+are run instead of pacers.py. Each function is called
+on generated inputs (hangul names in utf-8 and cp949,
+deep directory trees, large sources), and ops/sec and
+retained objects per call are reported.''')
+    parser.add_argument('--micro-samples', default=20, type=int,
+                        help='''Number of timing samples of each microbenchmark.
+The median ops/sec and its 95%% confidence interval
+are computed from the samples.
+default: 20''')
+    parser.add_argument('--compare', metavar='PREVIOUS_RESULT_JSON',
+                        help='''A previous result json file to be compared with.
+Phases and spans slower than the previous result
+by more than REGRESSION_THRESHOLD are reported.''')
+    parser.add_argument('--regression-threshold', default=.1, type=float,
+                        help='''Ratio of slowdown reported as a regression.
+default: 0.1 (10%%)''')
+    parser.add_argument('--bench-dir', default=opjoin('.', 'output-bench'),
+                        help='''Specify BENCH_DIR in which the synthetic assignment,
+the output of pacers.py, its log and the result json
+file to be generated.
+default: %s'''%'./output-bench')
+    parser.add_argument('--result-json',
+                        help='''Path of the result json file.
+default: BENCH_DIR/bench-YYYYmmdd-HHMMSS.json''')
+
+    gArgs = parser.parse_args()
+    try:
+        typeWeights = parseWeights(gArgs.types, gBenchSubmissionTypes)
+        behaviorWeights = parseWeights(gArgs.behaviors, gBenchBehaviors)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if gArgs.compare!=None:
+        oldBenchResult = loadBenchResult(gArgs.compare)
+        if ('micro' in oldBenchResult)!=gArgs.micro:
+            parser.error('%s is not a result of the same kind of benchmark.'%gArgs.compare)
+
+    date = datetime.datetime.now()
+    assignmentDir = opjoin(gArgs.bench_dir, 'bench-assignment')
+    outputDir = opjoin(gArgs.bench_dir, 'output')
+    logFilePath = opjoin(gArgs.bench_dir, 'pacers-log.txt')
+    microDir = opjoin(gArgs.bench_dir, 'micro')
+    resultFilePath = gArgs.result_json if gArgs.result_json!=None \
+            else opjoin(gArgs.bench_dir, 'bench-%s.json'%date.strftime('%Y%m%d-%H%M%S'))
+    pacersPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pacers.py')
+    pacersArgs = ['--timeout', str(gArgs.timeout), '--num-cores', str(gArgs.num_cores)]+gArgs.pacers_args
+
+    benchResult = {}
+    benchResult['date'] = date.isoformat()
+    benchResult['environment'] = getBenchEnvironment()
+
+    if not gArgs.micro:
+        print '%sGenerating a synthetic assignment with %d submissions in %s...'%(gLogPrefix, gArgs.num_students, assignmentDir)
+        submissionInfos = generateSyntheticAssignment(assignmentDir, gArgs.num_students, typeWeights, behaviorWeights,
+                                                      gArgs.source_lines, gArgs.seed)
+
+        print '%sRunning pacers.py (log: %s)...'%(gLogPrefix, logFilePath)
+        scenarioResults = runPipelineBenchmark(pacersPath, assignmentDir, outputDir, pacersArgs, gArgs.repeat, logFilePath)
+
+        benchResult['params'] = {'numStudents':gArgs.num_students, 'types':typeWeights, 'behaviors':behaviorWeights,
+                                 'sourceLines':gArgs.source_lines, 'seed':gArgs.seed, 'repeat':gArgs.repeat,
+                                 'pacersArgs':pacersArgs}
+        benchResult['submissions'] = submissionInfos
+        benchResult['scenarios'] = scenarioResults
+    else:
+        print '%sGenerating microbenchmark inputs in %s...'%(gLogPrefix, microDir)
+        microCases = getMicroBenchCases(microDir, gArgs.seed)
+
+        benchResult['params'] = {'micro':True, 'microSamples':gArgs.micro_samples, 'seed':gArgs.seed}
+        benchResult['micro'] = {}
+        benchResult['microCaseNames'] = []
+        for name, func, setup, numWarmupCalls in microCases:
+            print '%sMicrobenchmark: Running %s...'%(gLogPrefix, name)
+            benchResult['micro'][name] = runMicroBenchCase(func, setup, numWarmupCalls, gArgs.micro_samples)
+            benchResult['microCaseNames'].append(name)
+
+    writeBenchResult(benchResult, resultFilePath)
+
+    print
+    if not gArgs.micro:
+        printBenchSummary(benchResult)
+    else:
+        printMicroBenchSummary(benchResult)
+    print
+    print '%sThe result is written to \'%s\'.'%(gLogPrefix, resultFilePath)
+
+    if gArgs.compare!=None:
+        print
+        if not gArgs.micro:
+            numRegressions = printBenchComparison(oldBenchResult, benchResult, gArgs.regression_threshold)
+        else:
+            numRegressions = printMicroBenchComparison(oldBenchResult, benchResult, gArgs.regression_threshold)
+        if numRegressions > 0:
+            sys.exit(1)
+
+    print '%sDone.'%gLogPrefix
@@ -39,25 +39,33 @@ from pacerslib.unicode import *
 from pacerslib.version import *
 from pacerslib.process import *
 from pacerslib.submission import *
+from pacerslib.testcase import *
+from pacerslib.reference import *
+from pacerslib.similarity import *
+from pacerslib.timing import *
+from pacerslib.schedule import *
 
 ############################################
 # multi processing worker functions
+# results are returned to the parent process, which prints them (see progress functions in log.py)
 def worker_build(params):
-    numAllProjs, i, projInfo, q = params
-    buildRetCode, buildLog, buildVersion = buildOneProj(projInfo)
-    q.put([i, buildRetCode, buildLog, buildVersion])
-    printBuildResult(q.qsize(), numAllProjs, projInfo, buildRetCode, buildLog)
+    i, projInfo, scratchDir = params
+    startTime = time.time()
+    buildRetCode, buildLog, buildVersion = buildOneProj(projInfo, scratchDir)
+    return i, buildRetCode, buildLog, buildVersion, time.time()-startTime
 
 def worker_run(params):
-    buildRetCode, numAllProjs, i, projInfo, timeOut, q = params
+    buildRetCode, i, projInfo, timeOut, compareMode, floatTolerance, timeOutClock, abortAfterFailures, timeOutAfterTimeOut = params
+    startTime = time.time()
     if buildRetCode==0:
-        exitTypeList, stdoutStrList, userInputList = runOneProj(projInfo, timeOut)
+        exitTypeList, stdoutStrList, userInputList, testResultList = runOneProj(projInfo, timeOut, compareMode, floatTolerance, timeOutClock,
+                abortAfterFailures, timeOutAfterTimeOut)
     else:
         exitTypeList = [-1]
         stdoutStrList = ['Due to the build error.']
         userInputList = ['']
-    q.put([i, exitTypeList, stdoutStrList, userInputList])
-    printRunResult(q.qsize(), numAllProjs, projInfo, exitTypeList, stdoutStrList)
+        testResultList = [None]
+    return i, exitTypeList, stdoutStrList, userInputList, testResultList, time.time()-startTime
 
 
 
@@ -118,6 +126,57 @@ is reached. Useful for infinite loop cases.
 Setting zero seconds(--timeout 0) means unlimited execution time
 for each target program, which can be useful for GUI applications.
 default: 2.0''')
+    parser.add_argument('--timeout-clock', default='wall', choices=['wall', 'cpu'],
+                        help='''Clock with which TIMEOUT is measured.
+wall - wall clock time
+cpu - cpu time used by each target program (linux only),
+      so that verdicts are stable under load. Programs
+      not using cpu (e.g. sleeping) are killed after
+      %g*TIMEOUT seconds of wall clock time.
+default: wall'''%gCpuTimeOutWallFactor)
+    parser.add_argument('--abort-after-failures', default=0, type=int, metavar='K',
+                        help='''When a target program times out, fails to run or
+crashes (e.g. segmentation fault) for K user inputs
+or test cases in a row, it is not run for the
+remaining ones, which are marked as skipped in the
+report. 0 means never.
+default: 0''')
+    parser.add_argument('--timeout-after-timeout', type=float, metavar='TIMEOUT_AFTER_TIMEOUT',
+                        help='''When specified, TIMEOUT_AFTER_TIMEOUT(seconds) is used
+instead of TIMEOUT for the remaining user inputs or
+test cases of a target program after its first
+timeout, e.g. --timeout 10 --timeout-after-timeout 1.
+default: TIMEOUT''')
+    parser.add_argument('--test-cases', metavar='TEST_CASES_DIR',
+                        help='''Specify TEST_CASES_DIR that has NAME.in and NAME.out
+files for each test case. Each target program is run
+with the content of each NAME.in as its user input
+instead of USER_INPUT, and its output is compared
+with the content of NAME.out (if exists).
+The result of each test case is shown in the report.''')
+    parser.add_argument('--reference', metavar='REFERENCE_PATH',
+                        help='''Specify REFERENCE_PATH of a reference solution (a source
+file or a project directory), which is built and run
+in the same way as submissions. Its outputs for
+USER_INPUT (or test cases without NAME.out) are used as
+expected outputs for all submissions.
+Outputs of the reference solution are cached in
+OUTPUT_DIR, so it is run again only for new inputs
+or when its sources are changed.''')
+    parser.add_argument('--compare-mode', default='exact', choices=gCompareModes,
+                        help='''Specify how outputs are compared with expected outputs
+of test cases.
+exact - each line should be the same
+        (line endings are ignored).
+whitespace - whitespace-separated tokens should be
+        the same.
+float - same as whitespace, but numbers are regarded as
+        equal within FLOAT_TOLERANCE.
+default: exact''')
+    parser.add_argument('--float-tolerance', default=1e-6, type=float,
+                        help='''Absolute tolerance (or relative tolerance for expected
+values larger than 1) for --compare-mode float.
+default: 1e-6''')
     parser.add_argument('--run-only', action='store_true',
                     help='''When specified, run each target program without build.
 You may use it when you want change USER_INPUT without
@@ -133,13 +192,69 @@ PACERs runs programs in parallel by default. ''')
     parser.add_argument('--build-serial', action='store_true',
                         help='''When specified, build each target program in serial.
 PACERs builds programs in parallel by default. ''')
+    parser.add_argument('--report-serial', action='store_true',
+                        help='''When specified, render each row of the final report in serial.
+PACERs renders the report in parallel by default. ''')
     parser.add_argument('--run-only-serial', action='store_true',
                         help='''Shortcut for --run-only --run-serial.''')
     parser.add_argument('--num-cores', default=mp.cpu_count(), type=int,
-                        help='''Specify number of cpu cores used in building and running process.
+                        help='''Specify number of cpu cores used in building, running and reporting process.
 default: number of cpu cores in your machine.''')
+    parser.add_argument('--build-jobs', type=int,
+                        help='''Maximum number of projects built at the same time.
+default: NUM_CORES''')
+    parser.add_argument('--run-jobs', type=int,
+                        help='''Maximum number of projects run at the same time.
+default: NUM_CORES''')
+    parser.add_argument('--adaptive-jobs', action='store_true',
+                        help='''When specified, a new project is built or run only if
+the system load is lower than the number of cpu cores
+and enough memory is available (up to BUILD_JOBS and
+RUN_JOBS projects at the same time), so that heavy
+builds do not push the host into swap and programs are
+not timed out by other processes on a busy host.''')
+    parser.add_argument('--pin-cpus', action='store_true',
+                        help='''When specified, each target program is pinned to a
+dedicated cpu core and one core is reserved for PACERs
+itself (linux only), so that programs run in parallel
+do not perturb each other's execution time. At most
+(number of available cores - 1) projects are run at the
+same time.''')
+    parser.add_argument('--scratch-dir',
+                        help='''When specified, each cmake or single source project is
+built in a temporary directory in SCRATCH_DIR (e.g.
+/dev/shm, a RAM-backed tmpfs on linux) instead of
+OUTPUT_DIR, and only the built executables are copied
+to OUTPUT_DIR. The temporary directory is removed after
+each build, so builds are not slowed down by slow disks
+or network home directories.''')
     parser.add_argument('--no-report', action='store_true',
                         help='''When specified, the final report is not generated.''')
+    parser.add_argument('--sharded-report', action='store_true',
+                        help='''When specified, the final report only has a summary of
+each submission, and the source files and output of
+each submission are written to separate pages that are
+loaded when a row is expanded. Useful for large classes
+whose report is too large for web browsers.''')
+    parser.add_argument('--similarity', action='store_true',
+                        help='''When specified, C/C++ sources of all submissions are
+compared with each other, and pairs of submissions with
+similar sources are listed in the report in order of
+similarity. Variable names, literals and comments are
+ignored in the comparison.''')
+    parser.add_argument('--progress-json', metavar='PROGRESS_JSON_PATH',
+                        help='''Write progress events of the build and run phases
+(each finished project, with completed/failed/timeout
+counts, throughput and ETA) to PROGRESS_JSON_PATH
+as json lines, e.g. for external dashboards.''')
+    parser.add_argument('--profile', action='store_true',
+                        help='''When specified, the time spent in each phase (unzip,
+copy, scan, build, run, report) and in each configure,
+compile, execution, output decoding and source
+highlighting is recorded. A summary is printed at the
+end, and all records are written to
+OUTPUT_DIR/pacers-trace-ASSIGNMENT_ALIAS.json, which can
+be loaded in chrome://tracing or ui.perfetto.dev.''')
     parser.add_argument('--exclude-patterns', nargs='+', default=[''],
                         help='''Files containing EXCLUDE_PATTERNS in their relative path
 from each submission directory are excluded from the final report.
@@ -185,6 +300,15 @@ default: %s'''%'./output')
         gArgs.run_only = True 
         gArgs.run_serial = True
 
+    if gArgs.build_jobs==None:
+        gArgs.build_jobs = gArgs.num_cores
+    if gArgs.run_jobs==None:
+        gArgs.run_jobs = gArgs.num_cores
+
+    if gArgs.timeout_clock=='cpu' and not isCpuTimeSupported():
+        print '%sCannot measure cpu time of programs on this platform. --timeout-clock wall is used instead.'%gLogPrefix
+        gArgs.timeout_clock = 'wall'
+
     # print gArgs
     # print gArgs.exclude_patterns
     # exit()
@@ -203,6 +327,13 @@ default: %s'''%'./output')
     print
     print '%sStarting PACERs...'%gLogPrefix
 
+    if gArgs.profile:
+        startProfile(toString(opjoin(gArgs.output_dir, gProfileSpanDirName)))
+
+    gProgressJsonFile = None
+    if gArgs.progress_json!=None:
+        gProgressJsonFile = open(gArgs.progress_json, 'w')
+
     # preprocess --user-dict
     gArgs.user_dict = None
     if gArgs.user_dict!=None:
@@ -213,7 +344,30 @@ default: %s'''%'./output')
         print 'PACERs: Unable to access \'%s\'. Please check the assignment_dir again.'%gArgs.assignment_dir
         exit()
 
+    # check scratch_dir
+    if gArgs.scratch_dir!=None and not os.path.isdir(gArgs.scratch_dir):
+        print 'PACERs: Unable to access \'%s\'. Please check the SCRATCH_DIR again.'%gArgs.scratch_dir
+        exit()
+
+    # load test cases
+    testCases = None
+    if gArgs.test_cases!=None:
+        if not os.path.isdir(gArgs.test_cases):
+            print 'PACERs: Unable to access \'%s\'. Please check the TEST_CASES_DIR again.'%gArgs.test_cases
+            exit()
+        testCases = loadTestCases(gArgs.test_cases)
+        print '%s%d test cases are loaded from \'%s\'.'%(gLogPrefix, len(testCases), gArgs.test_cases)
+
+    # get expected outputs from the reference solution
+    if gArgs.reference!=None:
+        if not os.path.exists(gArgs.reference):
+            print 'PACERs: Unable to access \'%s\'. Please check the REFERENCE_PATH again.'%gArgs.reference
+            exit()
+        testCases = getReferenceTestCases(gArgs.reference, gArgs.user_input, testCases, gArgs.output_dir, gArgs.timeout)
+
+    phaseStartTime = time.time()
     unzipDirNames = unzipInAssignDir(gArgs.assignment_dir)
+    recordProfileSpan('unzip', 'phase', phaseStartTime)
 
     submissionTitles, submissionPaths = getSubmissionTitlesAndPaths(gArgs.assignment_dir)
 
@@ -224,6 +378,7 @@ default: %s'''%'./output')
     decodeAlias = unico2decoPath(gArgs.assignment_alias, deco2unicoMap)
     destDir = opjoin(gArgs.output_dir, decodeAlias)
 
+    phaseStartTime = time.time()
     if not gArgs.run_only:
         print '%sCopying all submissions from \'%s\' to \'%s\'...'%(gLogPrefix, gArgs.assignment_dir, destDir)
         # delete exsting one
@@ -240,6 +395,10 @@ default: %s'''%'./output')
             shutil.copytree(toString(gArgs.assignment_dir), toString(destDir))
         else:
             shutil.copytree(gArgs.assignment_dir, destDir)
+
+        # unidecode copied submissions and save the name map for later --run-only runs
+        decodeAllDestSubmissionDirPaths(submissionTitles, gArgs.assignment_dir, destDir, deco2unicoMap)
+        saveDeco2unicoMap(destDir, deco2unicoMap)
     else:
         # delete report file only
         try:
@@ -247,78 +406,174 @@ default: %s'''%'./output')
         except OSError:
             pass
 
+        # load the name map saved when the submissions were copied instead of deriving it again
+        if not loadDeco2unicoMap(destDir, deco2unicoMap):
+            decodeAllDestSubmissionDirPaths(submissionTitles, gArgs.assignment_dir, destDir, deco2unicoMap)
+
+    recordProfileSpan('copy', 'phase', phaseStartTime)
+
     # collect all project info
-    allProjInfos = collectAllProjInfosInAllSubmissions(submissionTitles, gArgs.assignment_dir, gArgs.exclude_patterns, gArgs.user_input, destDir, deco2unicoMap)
+    phaseStartTime = time.time()
+    allProjInfos = collectAllProjInfosInAllSubmissions(submissionTitles, gArgs.assignment_dir, gArgs.exclude_patterns, gArgs.user_input, destDir, deco2unicoMap,
+            test_cases=testCases)
+    recordProfileSpan('scan', 'phase', phaseStartTime)
 
     printLogPrefixDescription()
 
+    # durations of the previous runs, by which projects are handed to worker processes longest first
+    durationHistoryFilePath = getDurationHistoryFilePath(gArgs.output_dir, decodeAlias)
+    durationHistory = loadDurationHistory(durationHistoryFilePath)
+
     # build projects one by one
+    phaseStartTime = time.time()
     buildResults = [None]*len(allProjInfos)
     if not gArgs.run_only:
         if not gArgs.build_serial:
             print 
-            print '%sBuilding projects in parallel with %d cores...'%(gLogPrefix, gArgs.num_cores)
+            print '%sBuilding projects in parallel with %d jobs%s...'%(gLogPrefix, gArgs.build_jobs, ' (adaptive)' if gArgs.adaptive_jobs else '')
             print
-            p = mp.Pool(gArgs.num_cores)
-            q = mp.Manager().Queue()
-            p.map(worker_build, [(len(allProjInfos), i, allProjInfos[i], q) for i in range(len(allProjInfos))])
-            while not q.empty():
-                i, buildRetCode, buildLog, buildVersion = q.get()
+            progress = startProgress('build', len(allProjInfos), gArgs.build_jobs, gProgressJsonFile)
+            throttle = startThrottle('build') if gArgs.adaptive_jobs else None
+            p = mp.Pool(gArgs.build_jobs)
+            buildOrder = getLongestFirstOrder(allProjInfos, durationHistory['build'])
+            for i, buildRetCode, buildLog, buildVersion, duration in \
+                    imapThrottled(p, worker_build, [(i, allProjInfos[i], gArgs.scratch_dir) for i in buildOrder], gArgs.build_jobs, throttle):
                 buildResults[i] = [buildRetCode, buildLog, buildVersion]
+                durationHistory['build'][getProjKey(allProjInfos[i])] = duration
+                updateProgress(progress, allProjInfos[i], getBuildStatus(buildRetCode), duration)
+                printBuildResult(progress['numCompleted'], len(allProjInfos), allProjInfos[i], buildRetCode, buildLog)
+            p.close()
+            p.join()
+            finishProgress(progress)
+            if throttle!=None:
+                printThrottleSummary(throttle)
         else:
             print 
             print '%sBuilding projects in serial...'%gLogPrefix
             print
+            progress = startProgress('build', len(allProjInfos), 1, gProgressJsonFile)
             for i in range(len(allProjInfos)):
                 printBuildStart(i+1, len(allProjInfos), allProjInfos[i])
-                buildRetCode, buildLog, buildVersion = buildOneProj(allProjInfos[i])
+                startTime = time.time()
+                buildRetCode, buildLog, buildVersion = buildOneProj(allProjInfos[i], gArgs.scratch_dir)
                 buildResults[i] = [buildRetCode, buildLog, buildVersion]
+                durationHistory['build'][getProjKey(allProjInfos[i])] = time.time()-startTime
+                updateProgress(progress, allProjInfos[i], getBuildStatus(buildRetCode), time.time()-startTime)
                 printBuildResult(i+1, len(allProjInfos), allProjInfos[i], buildRetCode, buildLog)
+            finishProgress(progress)
     else:
         for i in range(len(allProjInfos)):
             buildResults[i] = [0, '', 'no-build-version']
 
+    recordProfileSpan('build', 'phase', phaseStartTime)
+
     # run projects one by one
+    phaseStartTime = time.time()
     runResults = [None]*len(allProjInfos)
     if not gArgs.build_only:
+        runJobs = gArgs.run_jobs if not gArgs.run_serial else 1
+        pinning = startCpuPinning(runJobs) if gArgs.pin_cpus else None
+        if pinning!=None:
+            runJobs = len(pinning['runCpus'])
+            print
+            print '%sPinning programs to cpus %s (cpus %s are reserved for PACERs)...'%(gLogPrefix,
+                    ', '.join(map(str, pinning['runCpus'])), ', '.join(map(str, pinning['reservedCpus'])))
+
         if not gArgs.run_serial:
             print 
-            print '%sRunning projects in parallel with %d cores...'%(gLogPrefix, gArgs.num_cores)
+            print '%sRunning projects in parallel with %d jobs%s...'%(gLogPrefix, runJobs, ' (adaptive)' if gArgs.adaptive_jobs else '')
             print
-            p = mp.Pool(gArgs.num_cores)
-            q = mp.Manager().Queue()
-            p.map(worker_run, [(buildResults[i][0], len(allProjInfos), i, allProjInfos[i], gArgs.timeout, q) for i in range(len(allProjInfos))])
-            while not q.empty():
-                i, exitTypeList, stdoutStrList, userInputList = q.get()
-                runResults[i] = [exitTypeList, stdoutStrList, userInputList]
+            progress = startProgress('run', len(allProjInfos), runJobs, gProgressJsonFile)
+            throttle = startThrottle('run') if gArgs.adaptive_jobs else None
+            if pinning!=None:
+                # each worker process takes its dedicated cpu from cpuQueue
+                cpuQueue = mp.Queue()
+                for cpu in pinning['runCpus']:
+                    cpuQueue.put(cpu)
+                p = mp.Pool(runJobs, initPinnedRunWorker, (cpuQueue,))
+            else:
+                p = mp.Pool(runJobs)
+            runOrder = getLongestFirstOrder(allProjInfos, durationHistory['run'])
+            for i, exitTypeList, stdoutStrList, userInputList, testResultList, duration in \
+                    imapThrottled(p, worker_run, [(buildResults[i][0], i, allProjInfos[i], gArgs.timeout, gArgs.compare_mode, gArgs.float_tolerance,
+                        gArgs.timeout_clock, gArgs.abort_after_failures, gArgs.timeout_after_timeout) for i in runOrder], runJobs, throttle):
+                runResults[i] = [exitTypeList, stdoutStrList, userInputList, testResultList]
+                # projects not run due to build errors would be recorded as taking no time
+                if buildResults[i][0]==0:
+                    durationHistory['run'][getProjKey(allProjInfos[i])] = duration
+                updateProgress(progress, allProjInfos[i], getRunStatus(exitTypeList), duration)
+                printRunResult(progress['numCompleted'], len(allProjInfos), allProjInfos[i], exitTypeList, stdoutStrList)
+            p.close()
+            p.join()
+            finishProgress(progress)
+            if throttle!=None:
+                printThrottleSummary(throttle)
         else:
             print 
             print '%sRunning projects in serial...'%gLogPrefix
             print
+            progress = startProgress('run', len(allProjInfos), 1, gProgressJsonFile)
+            if pinning!=None:
+                setPinnedCpu(pinning['runCpus'][0])
             for i in range(len(allProjInfos)):
                 printRunStart(i+1, len(allProjInfos), allProjInfos[i])
+                startTime = time.time()
                 if buildResults[i][0]==0:
-                    exitTypeList, stdoutStrList, userInputList = runOneProj(allProjInfos[i], gArgs.timeout)
+                    exitTypeList, stdoutStrList, userInputList, testResultList = runOneProj(allProjInfos[i], gArgs.timeout, gArgs.compare_mode, gArgs.float_tolerance,
+                            gArgs.timeout_clock, gArgs.abort_after_failures, gArgs.timeout_after_timeout)
                 else:
                     exitTypeList = [-1]
                     stdoutStrList = ['Due to build error.']
                     userInputList = ['']
-                runResults[i] = [exitTypeList, stdoutStrList, userInputList]
+                    testResultList = [None]
+                runResults[i] = [exitTypeList, stdoutStrList, userInputList, testResultList]
+                if buildResults[i][0]==0:
+                    durationHistory['run'][getProjKey(allProjInfos[i])] = time.time()-startTime
+                updateProgress(progress, allProjInfos[i], getRunStatus(exitTypeList), time.time()-startTime)
                 printRunResult(i+1, len(allProjInfos), allProjInfos[i], exitTypeList, stdoutStrList)
+            finishProgress(progress)
+
+        if pinning!=None:
+            finishCpuPinning(pinning)
     else:
         for i in range(len(allProjInfos)):
-            runResults[i] = [[-1], [''], ['']]
+            runResults[i] = [[-1], [''], [''], [None]]
+
+    recordProfileSpan('run', 'phase', phaseStartTime)
+
+    saveDurationHistory(durationHistoryFilePath, durationHistory)
 
     # generate report data
-    submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, userInputLists, submissionTypes, buildVersionSet = \
+    submittedFileNames, srcFileLists, destSrcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, userInputLists, testResultLists, submissionTypes, buildVersionSet = \
             generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDir, gArgs, deco2unicoMap)
 
     print
 
+    # detect similar sources
+    similarPairs = None
+    if gArgs.similarity and not gArgs.no_report:
+        print '%sDetecting similar submissions...'%gLogPrefix
+        with profileSpan('similarity', 'phase'):
+            similarPairs = getSimilarPairs(allProjInfos, gArgs.num_cores, gArgs.report_serial)
+
     if not gArgs.no_report:
         print '%sGenerating Report for %s...'%(gLogPrefix, gArgs.assignment_alias)
-        generateReport(gArgs, submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists,
-                userInputLists, submissionTypes, buildVersionSet)
+        with profileSpan('report', 'phase'):
+            generateReport(gArgs, submittedFileNames, srcFileLists, destSrcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists,
+                    userInputLists, testResultLists, submissionTypes, buildVersionSet, similarPairs)
 
     removeUnzipDirsInAssignDir(gArgs.assignment_dir, unzipDirNames)
+
+    if gArgs.profile:
+        spans = stopProfile()
+        traceFilePath = opjoin(gArgs.output_dir, 'pacers-trace-%s.json'%decodeAlias)
+        writeChromeTrace(spans, traceFilePath)
+        print
+        printProfileSummary(spans, gProfileNumTopSpans)
+        print
+        print '%sTrace events are written to \'%s\'.'%(gLogPrefix, traceFilePath)
+
+    if gProgressJsonFile!=None:
+        gProgressJsonFile.close()
+
     print '%sDone.'%gLogPrefix
@@ -0,0 +1,269 @@
+################################################################################
+# bench.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, sys, shutil, random, zipfile, json, time, subprocess, platform
+import multiprocessing as mp
+from global_const import *
+from unicode import *
+
+############################################
+# synthetic assignment functions
+# A synthetic assignment has numStudents submissions. The type and the program behavior of each submission
+# are drawn from typeWeights and behaviorWeights by a random generator seeded with seed,
+# so the same parameters always generate the same assignment.
+# submission types:
+#   single - a single source file (SINGLE_SOURCE_FILE)
+#   files - a directory with two source files (SOURCE_FILES)
+#   cmake - a directory with CMakeLists.txt and three source files (CMAKE_PROJECT)
+#   zip - a zip file of a directory with a single source file
+#   unicode - a single source file with a hangul name and a hangul comment in utf-8 or cp949
+# behaviors:
+#   fast - reads two integers and prints their sum
+#   timeout - runs forever without output
+#   flood - prints lines forever
+gBenchSubmissionTypes = ['single', 'files', 'cmake', 'zip', 'unicode']
+gBenchBehaviors = ['fast', 'timeout', 'flood']
+
+# return submissionInfos
+# submissionInfo:
+#   {'name':submission file or dir name, 'type':submission type, 'behavior':behavior}
+def generateSyntheticAssignment(assignmentDir, numStudents, typeWeights, behaviorWeights, sourceLines, seed):
+    rng = random.Random(seed)
+    # Convert paths for shutil to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        assignmentDir = toString(assignmentDir)
+    if os.path.exists(assignmentDir):
+        shutil.rmtree(assignmentDir)
+    os.makedirs(assignmentDir)
+
+    submissionInfos = []
+    for i in range(numStudents):
+        submissionType = getWeightedChoice(rng, typeWeights)
+        behavior = getWeightedChoice(rng, behaviorWeights)
+        name = 'student%03d'%(i+1)
+
+        if submissionType=='single':
+            name += '.c'
+            __writeSource(os.path.join(assignmentDir, name), getSyntheticSource(rng, behavior, sourceLines, name))
+        elif submissionType=='files':
+            os.makedirs(os.path.join(assignmentDir, name))
+            for probName in ['prob1.c', 'prob2.c']:
+                __writeSource(os.path.join(assignmentDir, name, probName), getSyntheticSource(rng, behavior, sourceLines, probName))
+        elif submissionType=='cmake':
+            os.makedirs(os.path.join(assignmentDir, name))
+            __writeSource(os.path.join(assignmentDir, name, 'CMakeLists.txt'),
+                    u'cmake_minimum_required(VERSION 2.6)\nproject(%s)\nadd_executable(test main.c utility.c)\n'%name)
+            __writeSource(os.path.join(assignmentDir, name, 'main.c'),
+                    getSyntheticSource(rng, behavior, sourceLines/2, 'main.c', u'#include "utility.h"'))
+            __writeSource(os.path.join(assignmentDir, name, 'utility.h'), u'int utility(int x);\n')
+            __writeSource(os.path.join(assignmentDir, name, 'utility.c'),
+                    getSyntheticFunctions(rng, sourceLines/2, u'utilityFunc')+u'int utility(int x)\n{\n    return utilityFunc0(x);\n}\n')
+        elif submissionType=='zip':
+            with zipfile.ZipFile(os.path.join(assignmentDir, name+'.zip'), 'w', zipfile.ZIP_DEFLATED) as z:
+                # fixed timestamp for the same zip file in every generation
+                zipInfo = zipfile.ZipInfo('%s/main.c'%name, (2017, 1, 1, 0, 0, 0))
+                zipInfo.compress_type = zipfile.ZIP_DEFLATED
+                z.writestr(zipInfo, getSyntheticSource(rng, behavior, sourceLines, 'main.c').encode('utf-8'))
+            name += '.zip'
+        elif submissionType=='unicode':
+            # the file name is in the filesystem encoding (like hangul names in test-assignments),
+            # and the contents are in utf-8 for odd students and cp949 for even students.
+            encoding = 'utf-8' if i%2==0 else 'cp949'
+            name = u'\ud559\uc0dd%03d.c'%(i+1)
+            __writeSource(opjoin(assignmentDir, name), getSyntheticSource(rng, behavior, sourceLines, u'\ud55c\uae00 - %s'%name), encoding)
+        else:
+            raise NotImplementedError
+
+        submissionInfos.append({'name':toUnicode(name), 'type':submissionType, 'behavior':behavior})
+    return submissionInfos
+
+# weights: {name:weight, ...}
+def getWeightedChoice(rng, weights):
+    names = sorted(weights)
+    r = rng.uniform(0, sum(weights.values()))
+    for name in names:
+        r -= weights[name]
+        if r < 0:
+            return name
+    return names[-1]
+
+def getSyntheticSource(rng, behavior, numLines, comment, header=u''):
+    lines = [u'/* %s */'%comment, u'#include <stdio.h>']
+    if header!=u'':
+        lines.append(header)
+    code = u'\n'.join(lines)+u'\n'+getSyntheticFunctions(rng, numLines)
+    code += u'int main()\n{\n'
+    if behavior=='fast':
+        code += u'    int a = 0, b = 0;\n    scanf("%d %d", &a, &b);\n    printf("%d\\n", a + b);\n'
+    elif behavior=='timeout':
+        code += u'    volatile unsigned long i = 0;\n    for (;;) i++;\n'
+    elif behavior=='flood':
+        code += u'    unsigned long i = 0;\n    for (;;) printf("flood %lu\\n", i++);\n'
+    else:
+        raise NotImplementedError
+    code += u'    return 0;\n}\n'
+    return code
+
+# about numLines lines of filler functions (func0, func1, ... for the default prefix)
+# prefix - should differ for each source file of a project, not to define the same functions twice
+def getSyntheticFunctions(rng, numLines, prefix=u'func'):
+    code = u''
+    for k in range(max(1, numLines/6)):
+        code += u'int %s%d(int x)\n{\n    int y = x * %d + %d;\n    if (y %% %d == 0) y /= %d;\n    return y;\n}\n'%(
+                prefix, k, rng.randint(1, 100), rng.randint(1, 100), rng.randint(2, 10), rng.randint(2, 10))
+    return code
+
+def __writeSource(filePath, sourceCode, encoding='utf-8'):
+    with open(filePath, 'wb') as f:
+        f.write(sourceCode.encode(encoding))
+
+############################################
+# pipeline benchmark functions
+# Each scenario runs pacers.py with --profile as a separate process, and the wall time, the durations of
+# phases (unzip, copy, scan, build, run, similarity, report) and the total durations of the other spans
+# (configure, compile, execute, decode, highlight) are read from its trace file.
+# scenarios:
+#   full - all phases from a clean OUTPUT_DIR
+#   run-only - only the run and report phases with the build output of the full scenario (--run-only)
+gBenchScenarios = [('full', []), ('run-only', ['--run-only'])]
+
+# return scenarioResults
+# scenarioResults: {scenarioName:{'wallTime':[...], 'phases':{phaseName:[...]}, 'spans':{spanName:[...]}}}
+#   each list has a value (seconds) for each repeat
+def runPipelineBenchmark(pacersPath, assignmentDir, outputDir, pacersArgs, numRepeats, logFilePath):
+    assignmentAlias = os.path.basename(os.path.normpath(assignmentDir))
+    traceFilePath = opjoin(outputDir, 'pacers-trace-%s.json'%assignmentAlias)
+
+    # Convert paths for shutil to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        tempOutputDir = toString(outputDir)
+    else:
+        tempOutputDir = outputDir
+
+    scenarioResults = {}
+    with open(logFilePath, 'w') as logFile:
+        for repeat in range(numRepeats):
+            if os.path.exists(tempOutputDir):
+                shutil.rmtree(tempOutputDir)
+
+            for scenarioName, scenarioArgs in gBenchScenarios:
+                print '%sBenchmark: Running scenario %s (%d/%d)...'%(gLogPrefix, scenarioName, repeat+1, numRepeats)
+                cmd = [sys.executable, pacersPath, assignmentDir, '--output-dir', outputDir, '--profile']+pacersArgs+scenarioArgs
+                logFile.write('$ %s\n'%' '.join(cmd))
+                logFile.flush()
+
+                startTime = time.time()
+                retCode = subprocess.call(cmd, stdout=logFile, stderr=subprocess.STDOUT)
+                wallTime = time.time()-startTime
+                if retCode!=0:
+                    raise RuntimeError('pacers.py failed with return code %d. See %s.'%(retCode, logFilePath))
+
+                result = scenarioResults.setdefault(scenarioName, {'wallTime':[], 'phases':{}, 'spans':{}})
+                result['wallTime'].append(wallTime)
+                for category, durs in getSpanDurations(traceFilePath).items():
+                    key = 'phases' if category=='phase' else 'spans'
+                    for name, dur in durs.items():
+                        result[key].setdefault(name, []).append(dur)
+    return scenarioResults
+
+# return {category:{spanName:total duration (sec)}} from a trace file written by --profile
+def getSpanDurations(traceFilePath):
+    with open(traceFilePath, 'r') as f:
+        events = json.load(f)['traceEvents']
+    spanDurations = {}
+    for event in events:
+        durs = spanDurations.setdefault(event['cat'] if event['cat']=='phase' else 'span', {})
+        durs[event['name']] = durs.get(event['name'], 0.)+event['dur']/1e6
+    return spanDurations
+
+def getBenchEnvironment():
+    return {'platform':platform.platform(), 'python':platform.python_version(), 'numCpus':mp.cpu_count()}
+
+def getMedian(values):
+    values = sorted(values)
+    n = len(values)
+    if n==0:
+        return 0.
+    return values[n/2] if n%2==1 else (values[n/2-1]+values[n/2])/2.
+
+############################################
+# benchmark result functions
+# benchResult:
+#   {'date':..., 'environment':{...}, 'params':{...}, 'submissions':[submissionInfo, ...], 'scenarios':scenarioResults}
+
+def writeBenchResult(benchResult, resultFilePath):
+    resultDir = os.path.dirname(resultFilePath)
+    if resultDir!='' and not os.path.isdir(resultDir):
+        os.makedirs(resultDir)
+    with open(resultFilePath, 'w') as f:
+        json.dump(benchResult, f, indent=2, sort_keys=True)
+
+def loadBenchResult(resultFilePath):
+    with open(resultFilePath, 'r') as f:
+        return json.load(f)
+
+# return [[scenarioName, kind, name, values], ...] where kind is 'wallTime', 'phases' or 'spans'
+def getBenchRows(benchResult):
+    rows = []
+    for scenarioName, scenarioArgs in gBenchScenarios:
+        if scenarioName not in benchResult['scenarios']:
+            continue
+        result = benchResult['scenarios'][scenarioName]
+        rows.append([scenarioName, 'wallTime', 'wall time', result['wallTime']])
+        for kind in ['phases', 'spans']:
+            for name in sorted(result[kind], key=lambda name: -getMedian(result[kind][name])):
+                rows.append([scenarioName, kind, name, result[kind][name]])
+    return rows
+
+def printBenchSummary(benchResult):
+    print '%sBenchmark summary (seconds):'%gLogPrefix
+    print
+    print '%-10s %-7s %-12s %10s %10s %10s'%('Scenario', 'Kind', 'Name', 'Median', 'Min', 'Max')
+    for scenarioName, kind, name, values in getBenchRows(benchResult):
+        print '%-10s %-7s %-12s %10.3f %10.3f %10.3f'%(scenarioName, kind if kind!='wallTime' else '', name,
+                getMedian(values), min(values), max(values))
+
+# compare medians of benchResult with oldBenchResult.
+# a row is marked as a regression if its median is slower than the old one by more than regressionThreshold (ratio)
+# and gBenchMinRegressionTime (sec), as very short spans are noisy.
+def printBenchComparison(oldBenchResult, benchResult, regressionThreshold):
+    print '%sComparison with the previous result (%s, seconds):'%(gLogPrefix, oldBenchResult['date'])
+    if oldBenchResult['params']!=benchResult['params']:
+        print '%sWarning: Benchmark parameters are different from the previous result.'%gLogPrefix
+    print
+    print '%-10s %-7s %-12s %10s %10s %8s'%('Scenario', 'Kind', 'Name', 'Old', 'New', 'Ratio')
+
+    oldValues = {}
+    for scenarioName, kind, name, values in getBenchRows(oldBenchResult):
+        oldValues[(scenarioName, kind, name)] = values
+
+    numRegressions = 0
+    for scenarioName, kind, name, values in getBenchRows(benchResult):
+        if (scenarioName, kind, name) not in oldValues:
+            continue
+        oldMedian = getMedian(oldValues[(scenarioName, kind, name)])
+        newMedian = getMedian(values)
+        ratio = newMedian/oldMedian if oldMedian > 0. else float('inf')
+        isRegression = ratio > 1.+regressionThreshold and newMedian-oldMedian > gBenchMinRegressionTime
+        if isRegression:
+            numRegressions += 1
+        print '%-10s %-7s %-12s %10.3f %10.3f %7.2fx%s'%(scenarioName, kind if kind!='wallTime' else '', name,
+                oldMedian, newMedian, ratio, ' (regression)' if isRegression else '')
+    print
+    print '%s%d regressions are found.'%(gLogPrefix, numRegressions)
+    return numRegressions
@@ -16,17 +16,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import os, subprocess, glob
+import os, subprocess, glob, shutil, tempfile
 from global_const import *
 from unicode import *
+from timing import *
 
-def buildOneProj(projInfo):
+def buildOneProj(projInfo, scratchDir=None):
     submissionType = projInfo['submissionType']
     projName = projInfo['projName']
     submissionDir = projInfo['submissionDir']
     filesInProj = projInfo['filesInProj']
 
-    buildRetCode, buildLog, buildVersion = buildProj(submissionType, submissionDir, projName, filesInProj)
+    buildRetCode, buildLog, buildVersion = buildProj(submissionType, submissionDir, projName, filesInProj, scratchDir)
 
     return buildRetCode, buildLog, buildVersion
 
@@ -40,35 +41,49 @@ def buildOneProj(projInfo):
 # buildVersion:
 #   cmake-version
 #   visual-cpp-version
+# scratchDir:
+#   None - cmake projects are built in buildDir (gBuildDirPrefix+projName in the submission dir)
+#   else - cmake projects are built in a temporary build dir in scratchDir (e.g. /dev/shm), which is removed
+#          after copying only the built executables to buildDir. Visual C++ projects are always built in buildDir.
 
-def buildProj(submissionType, submissionDir, projName, projSrcFileNames):
+def buildProj(submissionType, submissionDir, projName, projSrcFileNames, scratchDir=None):
     if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
-        buildRetCode, buildLog, buildVersion = build_single_source(submissionDir, projName, projSrcFileNames[0])
+        buildRetCode, buildLog, buildVersion = build_single_source(submissionDir, projName, projSrcFileNames[0], scratchDir)
     elif submissionType==CMAKE_PROJECT:
-        buildRetCode, buildLog, buildVersion = build_cmake(submissionDir, projName)
+        buildRetCode, buildLog, buildVersion = build_cmake(submissionDir, projName, scratchDir)
     elif submissionType==VISUAL_CPP_PROJECT:
         buildRetCode, buildLog, buildVersion = build_vcxproj(submissionDir, projName)
     return buildRetCode, buildLog, buildVersion
 
 ####
 # build_single functions
-def build_single_source(srcRootDir, projName, singleSrcFileName):
+def build_single_source(srcRootDir, projName, singleSrcFileName, scratchDir=None):
     extension = os.path.splitext(singleSrcFileName)[1].lower()
     if extension in gSourceExt:
-        return eval(gSourceExt[extension]['build-single-source-func'])(srcRootDir, projName, singleSrcFileName)
+        return eval(gSourceExt[extension]['build-single-source-func'])(srcRootDir, projName, singleSrcFileName, scratchDir)
     else:
         return build_single_else(extension)
 
-def build_single_c_cpp(srcRootDir, projName, singleSrcFileName):
+def build_single_c_cpp(srcRootDir, projName, singleSrcFileName, scratchDir=None):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     try:
         os.makedirs(buildDir)
     except Exception as e:
         return -1, toUnicode(str(e)), 'cmake-version'
 
-    makeCMakeLists_single_c_cpp(projName, singleSrcFileName, buildDir)
+    if scratchDir==None:
+        makeCMakeLists_single_c_cpp(projName, '../'+singleSrcFileName, buildDir)
+        return __build_cmake(buildDir, './')
 
-    return __build_cmake(buildDir, './')
+    try:
+        scratchBuildDir = makeScratchBuildDir(scratchDir, projName)
+    except Exception as e:
+        return -1, toUnicode(str(e)), 'cmake-version'
+    try:
+        makeCMakeLists_single_c_cpp(projName, getCMakePath(os.path.abspath(opjoin(srcRootDir, singleSrcFileName))), scratchBuildDir)
+        return __build_cmake_in_scratch_dir(scratchBuildDir, './', buildDir)
+    finally:
+        removeScratchBuildDir(scratchBuildDir)
 
 # def build_single_dummy(srcRootDir, projName, srcFileNames):
     # return 0, ''
@@ -79,37 +94,114 @@ def build_single_else(extension):
 
 ####
 # build_cmake functions
-def build_cmake(srcRootDir, projName):
+def build_cmake(srcRootDir, projName, scratchDir=None):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     try:
         os.makedirs(buildDir)
     except Exception as e:
         return -1, toUnicode(str(e)), 'cmake-version'
-    return __build_cmake(buildDir, '../')
 
-def __build_cmake(buildDir, cmakeLocationFromBuildDir):
+    if scratchDir==None:
+        return __build_cmake(buildDir, '../')
+
     try:
-        if os.name=='posix':
-            buildLog = toUnicode(subprocess.check_output('cd "%s" && %s'%(toString(buildDir), toString(gOSEnv[os.name]['cmake-cmd'](cmakeLocationFromBuildDir))), stderr=subprocess.STDOUT, shell=True))
-        else:
-            buildLog = toUnicode(subprocess.check_output('pushd "%s" && %s && popd'%(toString(buildDir), toString(gOSEnv[os.name]['cmake-cmd'](cmakeLocationFromBuildDir))), stderr=subprocess.STDOUT, shell=True))
-    except subprocess.CalledProcessError as e:
-        return e.returncode, toUnicode(e.output), 'cmake-version'
+        scratchBuildDir = makeScratchBuildDir(scratchDir, projName)
+    except Exception as e:
+        return -1, toUnicode(str(e)), 'cmake-version'
+    try:
+        return __build_cmake_in_scratch_dir(scratchBuildDir, '"%s"'%getCMakePath(os.path.abspath(srcRootDir)), buildDir)
+    finally:
+        removeScratchBuildDir(scratchBuildDir)
+
+def __build_cmake(buildDir, cmakeLocationFromBuildDir):
+    # configure and compile steps are run separately only for --profile to record their durations,
+    # as running them in a single command is faster on Windows (vcvars32.bat is called once).
+    if isProfileEnabled():
+        spanNamesAndCmds = [('configure', gOSEnv[os.name]['cmake-configure-cmd'](cmakeLocationFromBuildDir)),
+                            ('compile', gOSEnv[os.name]['cmake-compile-cmd'])]
     else:
-        return 0, buildLog, 'cmake-version'
+        spanNamesAndCmds = [('build', gOSEnv[os.name]['cmake-cmd'](cmakeLocationFromBuildDir))]
+
+    buildLogs = []
+    for spanName, cmd in spanNamesAndCmds:
+        try:
+            with profileSpan(spanName, 'build', {'dir':buildDir}):
+                if os.name=='posix':
+                    buildLog = subprocess.check_output('cd "%s" && %s'%(toString(buildDir), toString(cmd)), stderr=subprocess.STDOUT, shell=True)
+                else:
+                    buildLog = subprocess.check_output('pushd "%s" && %s && popd'%(toString(buildDir), toString(cmd)), stderr=subprocess.STDOUT, shell=True)
+        except subprocess.CalledProcessError as e:
+            buildLogs.append(outputToUnicode(e.output, buildDir))
+            return e.returncode, u''.join(buildLogs), 'cmake-version'
+        buildLogs.append(outputToUnicode(buildLog, buildDir))
+    return 0, u''.join(buildLogs), 'cmake-version'
+
+def __build_cmake_in_scratch_dir(scratchBuildDir, cmakeLocationFromBuildDir, buildDir):
+    buildRetCode, buildLog, buildVersion = __build_cmake(scratchBuildDir, cmakeLocationFromBuildDir)
+    if buildRetCode==0:
+        copyExecutables(scratchBuildDir, buildDir)
+    return buildRetCode, buildLog, buildVersion
 
 # return CMakeLists.txt code
-def makeCMakeLists_single_c_cpp(projName, singleSrcFileName, buildDir):
+# srcPathFromBuildDir - path of the source file relative to buildDir (or absolute path)
+def makeCMakeLists_single_c_cpp(projName, srcPathFromBuildDir, buildDir):
     code = u''
     code += 'cmake_minimum_required(VERSION 2.6)\n'
     code += 'project(%s)\n'%projName
     code += 'add_executable(%s '%projName
-    code += '../%s'%singleSrcFileName
+    code += '"%s"'%srcPathFromBuildDir
     code += ')\n'
 
     with open(opjoin(buildDir,'CMakeLists.txt'), 'w') as f:
         f.write(toString(code))
 
+# cmake accepts only forward slashes in paths
+def getCMakePath(path):
+    return path.replace('\\', '/')
+
+####
+# scratch build dir functions for --scratch-dir
+
+def makeScratchBuildDir(scratchDir, projName):
+    # Convert paths for tempfile to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        return toUnicode(tempfile.mkdtemp(prefix=toString(gBuildDirPrefix+projName)+'-', dir=toString(scratchDir)))
+    else:
+        return tempfile.mkdtemp(prefix=gBuildDirPrefix+projName+'-', dir=scratchDir)
+
+def removeScratchBuildDir(scratchBuildDir):
+    # Convert paths for shutil to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        shutil.rmtree(toString(scratchBuildDir), True)
+    else:
+        shutil.rmtree(scratchBuildDir, True)
+
+# copy executables in scratchBuildDir to the same relative paths in buildDir.
+# CMakeFiles dirs are skipped, as they only have intermediate files and test programs of cmake.
+def copyExecutables(scratchBuildDir, buildDir):
+    # Convert paths for os.walk and shutil to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        tempScratchBuildDir = toString(scratchBuildDir)
+        tempBuildDir = toString(buildDir)
+    else:
+        tempScratchBuildDir = scratchBuildDir
+        tempBuildDir = buildDir
+    for root, dirs, files in os.walk(tempScratchBuildDir):
+        if 'CMakeFiles' in dirs:
+            dirs.remove('CMakeFiles')
+        for name in files:
+            filePath = os.path.join(root, name)
+            if isExecutable(filePath):
+                destDir = os.path.join(tempBuildDir, os.path.relpath(root, tempScratchBuildDir))
+                if not os.path.isdir(destDir):
+                    os.makedirs(destDir)
+                shutil.copy2(filePath, destDir)
+
+def isExecutable(filePath):
+    if os.name=='nt':
+        return os.path.splitext(filePath)[1].lower() in ['.exe', '.dll']
+    return os.path.isfile(filePath) and os.access(filePath, os.X_OK)
+
 ####
 # build_vcxproj functions
 def build_vcxproj(srcRootDir, projName):
@@ -130,11 +222,12 @@ def build_vcxproj(srcRootDir, projName):
     try:
         # print 'vcvars32.bat && msbuild.exe "%s" /property:OutDir="%s/";IntDir="%s/"'\
                 # %(vcxprojNames[0], gBuildDirPrefix+projName, gBuildDirPrefix+projName)
-        buildLog = toUnicode(subprocess.check_output('vcvars32.bat && msbuild.exe "%s" /property:OutDir="%s/";IntDir="%s/"'
-                %(toString(vcxprojNames[0]), toString(gBuildDirPrefix+projName), toString(gBuildDirPrefix+projName)),
-                stderr=subprocess.STDOUT, shell=True))
+        with profileSpan('compile', 'build', {'dir':srcRootDir}):
+            buildLog = outputToUnicode(subprocess.check_output('vcvars32.bat && msbuild.exe "%s" /property:OutDir="%s/";IntDir="%s/"'
+                    %(toString(vcxprojNames[0]), toString(gBuildDirPrefix+projName), toString(gBuildDirPrefix+projName)),
+                    stderr=subprocess.STDOUT, shell=True), srcRootDir)
     except subprocess.CalledProcessError as e:
-        return e.returncode, toUnicode(e.output), 'visual-cpp-version'
+        return e.returncode, outputToUnicode(e.output, srcRootDir), 'visual-cpp-version'
     else:
         return 0, buildLog, 'visual-cpp-version'
 
@@ -40,7 +40,8 @@ def unzipInAssignDir(assignDir):
                 try:
                     unzipDir = os.path.splitext(filePath)[0]
                     try:
-                        shutil.rmtree(unzipDir)
+                        # Convert paths for shutil to byte string only for posix os (due to python bug?)
+                        shutil.rmtree(toString(unzipDir))
                     except OSError:
                         pass
                     subprocess.check_output('unzip "%s" -d "%s"'%(filePath, unzipDir), stderr=subprocess.STDOUT, shell=True)
@@ -64,7 +65,11 @@ def unzipInAssignDir(assignDir):
 def removeUnzipDirsInAssignDir(assignDir, unzipDirNames):
     for d in unzipDirNames:
         try:
-            shutil.rmtree(d)
+            # Convert paths for shutil to byte string only for posix os (due to python bug?)
+            if os.name=='posix':
+                shutil.rmtree(toString(d))
+            else:
+                shutil.rmtree(d)
         except:
             pass
 
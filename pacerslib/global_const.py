@@ -29,6 +29,59 @@ END_SUBMISSION_TYPE   = 5
 
 gLogPrefix = '# '
 gBuildDirPrefix = 'pacers-build-'
+gDeco2unicoMapFileName = 'pacers-deco2unico.json'
+gHighlightCacheDirName = 'pacers-highlight-cache'
+gRowFragmentDirName = 'pacers-report-fragments'
+gReferenceCacheDirName = 'pacers-reference-cache'
+gProfileSpanDirName = 'pacers-profile-spans'
+
+############################################
+# progress
+# see log.py
+gProgressStatusInterval = 5.
+
+############################################
+# job scheduling
+# see schedule.py
+gJobPollInterval = .5
+gAdaptiveJobsMaxLoadPerCore = 1.
+gAdaptiveJobsMinAvailableMemory = 512*1024*1024
+gPinReservedCpus = 1
+gCpuSetSize = 1024
+
+############################################
+# --timeout-clock cpu
+# see run.py
+# programs are also killed after gCpuTimeOutWallFactor*TIMEOUT seconds of wall time (e.g. sleeping programs)
+# or after writing more than gCpuTimeOutMaxOutputSize bytes (e.g. programs printing forever, which mostly wait for
+# PACERs reading their output and use little cpu time).
+gCpuTimeOutPollInterval = .02
+gCpuTimeOutWallFactor = 5.
+gCpuTimeOutMaxOutputSize = 64*1024*1024
+
+############################################
+# --test-cases
+# see testcase.py
+# a pending line or token longer than every expected one is reported as a mismatch without waiting for its end,
+# but numeric tokens in --compare-mode float may be up to gFloatTokenMaxLength bytes (e.g. 1.000000 for 1).
+gFloatTokenMaxLength = 1024
+
+############################################
+# --profile
+# see timing.py
+gProfileDirEnvName = 'PACERS_PROFILE_DIR'
+gProfileNumTopSpans = 10
+
+############################################
+# pacers-bench.py
+# see bench.py
+gBenchMinRegressionTime = .05
+# see microbench.py
+gMicroBenchMinSampleTime = .02
+gMicroBenchNumNames = 256
+gMicroBenchNumStudents = 40
+gMicroBenchTreeDepth = 12
+gMicroBenchLargeSourceLines = 6000
 
 gSubmissionTypeDescrption                        = {}
 gSubmissionTypeDescrption[CMAKE_PROJECT]         = 'CMAKE_PROJECT - the submission has CMakeLists.txt.'
@@ -64,6 +117,65 @@ gSourceExt['.cpp']['build-single-source-func'] = 'build_single_c_cpp'
 gSourceExt['.cpp']['runcmd-single-source-func'] = 'runcmd_single_c_cpp'
 gSourceExt['.cpp']['runcwd-single-source-func'] = 'runcwd_single_c_cpp'
 
+gSourceExt['.c']['lexer'] = 'c'
+gSourceExt['.cpp']['lexer'] = 'cpp'
+
+############################################
+# report source files
+# Source files larger than gReportMaxSourceSize bytes or detected as binary files are listed with
+# their sizes instead of rendered. Text files larger than gReportTruncatedSourceSize bytes are
+# rendered only up to gReportTruncatedSourceSize bytes.
+gReportMaxSourceSize = 8*1024*1024
+gReportTruncatedSourceSize = 256*1024
+gReportBinarySniffSize = 8*1024
+
+############################################
+# report outputs
+# see renderOutputText() in report.py
+gReportMaxOutputLength = 64*1024
+gReportMaxRepeatedLines = 10
+
+############################################
+# source similarity
+# see similarity.py
+# gSimilarityKgramSize - number of tokens in a k-gram
+# gSimilarityWindowSize - number of consecutive k-grams in a winnowing window
+# fingerprints shared by more than min(gSimilarityMaxCommonFingerprintProjs,
+# max(gSimilarityMinCommonFingerprintProjs, gSimilarityCommonFingerprintRatio*numAllProjs)) projects
+# are ignored as boilerplate (e.g. provided skeleton code or common idioms).
+# A lower ratio drops more shared code, but may miss code copied among many students; a higher ratio finds
+# such groups at the cost of more noise. Each fingerprint adds pairs quadratic in the number of its projects,
+# so gSimilarityMaxCommonFingerprintProjs bounds the pairs per fingerprint to keep the time linear in large classes.
+gSimilarityKgramSize = 5
+gSimilarityWindowSize = 4
+gSimilarityMinCommonFingerprintProjs = 2
+gSimilarityMaxCommonFingerprintProjs = 20
+gSimilarityCommonFingerprintRatio = .1
+gSimilarityMinSimilarity = .5
+gSimilarityMinSharedFingerprints = 5
+gSimilarityMaxPairs = 100
+
+############################################
+# gLexerAliases
+# file extension (or whole file name) -> pygments lexer alias used to render source files in the report.
+# files not in gLexerAliases are rendered by the lexer guessed by pygments.guess_lexer_for_filename().
+gLexerAliases = {}
+for ext in gSourceExt:
+    gLexerAliases[ext] = gSourceExt[ext]['lexer']
+
+gLexerAliases['.h']     = 'c'
+gLexerAliases['.cc']    = 'cpp'
+gLexerAliases['.cxx']   = 'cpp'
+gLexerAliases['.hpp']   = 'cpp'
+gLexerAliases['.hxx']   = 'cpp'
+gLexerAliases['.hh']    = 'cpp'
+gLexerAliases['.txt']   = 'text'
+gLexerAliases['.cmake'] = 'cmake'
+gLexerAliases['CMakeLists.txt'] = 'cmake'
+
+# lexer aliases of source files compared by similarity.py
+gSimilarityLexers = ['c', 'cpp']
+
 ############################################
 # gOSEnv
 gOSEnv = {'nt':{}, 'posix':{}}
@@ -71,6 +183,12 @@ gOSEnv = {'nt':{}, 'posix':{}}
 gOSEnv['nt']['cmake-cmd'] = lambda cmakeLocationFromBuildDir: 'vcvars32.bat && cmake %s -G "NMake Makefiles" && nmake'%cmakeLocationFromBuildDir
 gOSEnv['posix']['cmake-cmd'] = lambda cmakeLocationFromBuildDir: 'cmake %s && make'%cmakeLocationFromBuildDir
 
+# configure and compile steps of cmake-cmd, which are run separately for --profile
+gOSEnv['nt']['cmake-configure-cmd'] = lambda cmakeLocationFromBuildDir: 'vcvars32.bat && cmake %s -G "NMake Makefiles"'%cmakeLocationFromBuildDir
+gOSEnv['posix']['cmake-configure-cmd'] = lambda cmakeLocationFromBuildDir: 'cmake %s'%cmakeLocationFromBuildDir
+gOSEnv['nt']['cmake-compile-cmd'] = 'vcvars32.bat && nmake'
+gOSEnv['posix']['cmake-compile-cmd'] = 'make'
+
 gOSEnv['nt']['cmake-version'] = 'getCMakeVersionWindows'
 gOSEnv['posix']['cmake-version'] = 'getCMakeVersionPosix'
 gOSEnv['nt']['visual-cpp-version'] = 'getVisulCppVersionWindows'
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
+import time, json
 from global_const import *
 
 ############################################
@@ -109,4 +110,92 @@ def printRunStart(processedCount, numAllProjs, projInfo):
 
     print '%s Starting execution...'%logPrefix
 
-
+############################################
+# progress functions
+# Build and run results of worker processes are sent to the parent process, which is the only process
+# that prints logs, so that the processed count is correct and log lines are not interleaved.
+# progress:
+#   state of a build or run phase made by startProgress() and updated by updateProgress() for each finished project.
+#   if progressJsonFile is not None, the same events are written to it as json lines.
+# status of a project:
+#   'succeeded', 'failed', 'timeout'
+
+def startProgress(phase, numAllProjs, numWorkers, progressJsonFile=None):
+    progress = {}
+    progress['phase'] = phase
+    progress['numAllProjs'] = numAllProjs
+    progress['numWorkers'] = numWorkers
+    progress['numCompleted'] = 0
+    progress['statusCounts'] = {'succeeded':0, 'failed':0, 'timeout':0}
+    progress['totalDuration'] = 0.
+    progress['startTime'] = time.time()
+    progress['lastStatusTime'] = progress['startTime']
+    progress['progressJsonFile'] = progressJsonFile
+    writeProgressEvent(progress, {'event':'start'})
+    return progress
+
+# duration - time spent for the project by a worker process
+def updateProgress(progress, projInfo, status, duration):
+    progress['numCompleted'] += 1
+    progress['statusCounts'][status] += 1
+    progress['totalDuration'] += duration
+    writeProgressEvent(progress, {'event':'project', 'submissionTitle':projInfo['submissionTitle'],
+        'projName':projInfo['projName'], 'status':status, 'duration':duration})
+
+    # print the status line only periodically not to flood the log
+    if time.time()-progress['lastStatusTime'] >= gProgressStatusInterval:
+        printProgressStatus(progress)
+
+def finishProgress(progress):
+    printProgressStatus(progress)
+    writeProgressEvent(progress, {'event':'finish'})
+
+def printProgressStatus(progress):
+    progress['lastStatusTime'] = time.time()
+    counts = progress['statusCounts']
+    eta = getProgressETA(progress)
+    print '%s[%s progress] %d/%d done - succeeded: %d, failed: %d, timeout: %d - %.2f projects/sec - ETA %s'%(gLogPrefix,
+            progress['phase'], progress['numCompleted'], progress['numAllProjs'], counts['succeeded'], counts['failed'], counts['timeout'],
+            getProgressThroughput(progress), getDurationStr(eta) if eta!=None else 'unknown')
+
+def getProgressThroughput(progress):
+    elapsedTime = time.time()-progress['startTime']
+    if elapsedTime <= 0.:
+        return 0.
+    return progress['numCompleted']/elapsedTime
+
+# the remaining projects are expected to take the mean duration of finished ones,
+# and to be processed by all workers at the same time.
+def getProgressETA(progress):
+    if progress['numCompleted']==0:
+        return None
+    meanDuration = progress['totalDuration']/progress['numCompleted']
+    numRemaining = progress['numAllProjs']-progress['numCompleted']
+    return meanDuration*numRemaining/max(1, min(progress['numWorkers'], numRemaining))
+
+def getDurationStr(seconds):
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d'%(seconds/3600, seconds%3600/60, seconds%60)
+
+def writeProgressEvent(progress, event):
+    if progress['progressJsonFile']==None:
+        return
+    event['time'] = time.time()
+    event['phase'] = progress['phase']
+    event['numCompleted'] = progress['numCompleted']
+    event['numAllProjs'] = progress['numAllProjs']
+    event['statusCounts'] = progress['statusCounts']
+    event['throughput'] = getProgressThroughput(progress)
+    event['eta'] = getProgressETA(progress)
+    progress['progressJsonFile'].write(json.dumps(event)+'\n')
+    progress['progressJsonFile'].flush()
+
+def getBuildStatus(buildRetCode):
+    return 'succeeded' if buildRetCode==0 else 'failed'
+
+def getRunStatus(exitTypeList):
+    if 1 in exitTypeList:
+        return 'timeout'
+    elif -1 in exitTypeList or 2 in exitTypeList:
+        return 'failed'
+    return 'succeeded'
@@ -0,0 +1,202 @@
+################################################################################
+# microbench.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, shutil, gc, math, timeit, itertools, random
+from global_const import *
+from unicode import *
+from submission import *
+from process import *
+from report import *
+from bench import *
+
+############################################
+# microbenchmark functions for pacers-bench.py --micro
+# Each case calls a hot helper function repeatedly on generated inputs (hangul names in utf-8 and cp949,
+# deep directory trees, large sources).
+# Each case is warmed up by numWarmupCalls calls (e.g. a whole cycle of its inputs to fill memos), and
+# a sample is the time of numLoops calls with gc disabled (like timeit), where numLoops is calibrated so that
+# a sample takes at least gMicroBenchMinSampleTime. Cases with a setup function (e.g. clearing a cache)
+# call setup before each call and time each call separately.
+# The median of the samples and its distribution-free 95% confidence interval are reported.
+# Python 2 has no tracemalloc, so allocations are reported as the number of gc-tracked objects
+# retained per call (e.g. growth of memos and caches).
+
+# return microCases
+# microCase: [name, func, setup or None, numWarmupCalls]
+def getMicroBenchCases(fixtureDir, seed):
+    if os.path.exists(toString(fixtureDir)):
+        shutil.rmtree(toString(fixtureDir))
+    os.makedirs(toString(fixtureDir))
+
+    # names - hangul names, which are unidecoded to 'hagsaeng000_gwaje0.c', 'hagsaeng001_gwaje1.c', ...
+    uniNames = [u'\ud559\uc0dd%03d_\uacfc\uc81c%d.c'%(i, i%5) for i in range(gMicroBenchNumNames)]
+    asciiNames = [unidecode(name) for name in uniNames]
+    utf8Names = [name.encode('utf-8') for name in uniNames]
+    cp949Names = [name.encode('cp949') for name in uniNames]
+    # deep paths - hangul dir names, which are unidecoded to 'poldeo00/poldeo01/...'
+    uniDeepDir = os.sep.join(u'\ud3f4\ub354%02d'%k for k in range(gMicroBenchTreeDepth))
+    uniDeepPaths = [os.path.join(uniDeepDir, name) for name in uniNames]
+    asciiDeepPaths = [os.path.join(unidecode(uniDeepDir), name) for name in asciiNames]
+
+    # scanner - a synthetic assignment and a cmake submission with a deep tree
+    assignmentDir = opjoin(fixtureDir, 'assignment')
+    generateSyntheticAssignment(assignmentDir, gMicroBenchNumStudents, {'single':2, 'files':2, 'cmake':1, 'unicode':1},
+                                {'fast':1}, 50, seed)
+    generateDeepTreeSubmission(opjoin(assignmentDir, 'student-deep'), gMicroBenchTreeDepth, uniNames[:4])
+    submissionTitles, submissionPaths = getSubmissionTitlesAndPaths(assignmentDir)
+
+    # renderer - large sources in utf-8 and cp949, and a source larger than gReportTruncatedSourceSize
+    sourcesDir = opjoin(fixtureDir, 'sources')
+    outputDir = opjoin(fixtureDir, 'output')
+    os.makedirs(toString(sourcesDir))
+    rng = random.Random(seed)
+    srcPaths = []
+    for fileName, numLines, encoding in [('large-utf8.c', gMicroBenchLargeSourceLines, 'utf-8'),
+                                         ('large-cp949.c', gMicroBenchLargeSourceLines, 'cp949'),
+                                         ('truncated.c', gMicroBenchLargeSourceLines*4, 'utf-8')]:
+        srcPath = opjoin(sourcesDir, fileName)
+        with open(toString(srcPath), 'wb') as f:
+            f.write(getSyntheticSource(rng, 'fast', numLines, u'\ud55c\uae00 - %s'%fileName).encode(encoding))
+        srcPaths.append(srcPath)
+    clearHighlightCache = lambda: shutil.rmtree(toString(getHighlightCacheDir(outputDir, u'micro')), True)
+
+    n = gMicroBenchNumNames
+    microCases = []
+    microCases.append(['opjoin ascii', __cycleCall(lambda name: opjoin('student001', name), asciiNames), None, n])
+    microCases.append(['opjoin utf-8 bytes', __cycleCall(lambda name: opjoin(utf8Names[0], name), utf8Names), None, n])
+    microCases.append(['opjoin deep unicode', __cycleCall(lambda name: opjoin(uniDeepDir, name), uniNames), None, n])
+    microCases.append(['toUnicode ascii', __cycleCall(toUnicode, asciiNames), None, n])
+    microCases.append(['toUnicode utf-8', __cycleCall(toUnicode, utf8Names), None, n])
+    microCases.append(['toUnicode cp949', __cycleCall(toUnicode, cp949Names), None, n])
+    microCases.append(['toUnicode cp949 memo miss', __cycleCall(toUnicode, cp949Names), gDecodeMemo.clear, 1])
+    microCases.append(['unico2decoPath ascii deep', __cycleCall(lambda path: unico2decoPath(path, {}), asciiDeepPaths), None, n])
+    microCases.append(['unico2decoPath hangul deep', __cycleCall(lambda path: unico2decoPath(path, {}), uniDeepPaths), None, n])
+    microCases.append(['collectAllProjInfos (%d submissions)'%len(submissionTitles),
+                       lambda: collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir), None, 1])
+    microCases.append(['getSourcesTable cached',
+                       lambda: getSourcesTable(srcPaths, srcPaths, sourcesDir, outputDir, u'micro'), None, 1])
+    microCases.append(['getSourcesTable uncached',
+                       lambda: getSourcesTable(srcPaths, srcPaths, sourcesDir, outputDir, u'micro'), clearHighlightCache, 1])
+    return microCases
+
+# a cmake submission whose sources are in depth nested dirs
+def generateDeepTreeSubmission(submissionDir, depth, uniNames):
+    os.makedirs(toString(submissionDir))
+    with open(toString(opjoin(submissionDir, 'CMakeLists.txt')), 'wb') as f:
+        f.write('cmake_minimum_required(VERSION 2.6)\nproject(deep)\n')
+    treeDir = submissionDir
+    for k in range(depth):
+        treeDir = opjoin(treeDir, u'\ud3f4\ub354%02d'%k)
+        os.makedirs(toString(treeDir))
+        for name in uniNames:
+            with open(toString(opjoin(treeDir, name)), 'wb') as f:
+                f.write('int main() { return 0; }\n')
+
+# return a function calling func with the next item of items for each call
+def __cycleCall(func, items):
+    iterator = itertools.cycle(items)
+    return lambda: func(next(iterator))
+
+# return microResult
+# microResult: {'secPerOp':[sec per call of each sample], 'numLoops':calls per sample, 'retainedObjectsPerOp':...}
+def runMicroBenchCase(func, setup, numWarmupCalls, numSamples):
+    for k in range(numWarmupCalls):
+        __timeLoops(func, 1, setup)
+
+    numLoops = 1
+    if setup==None:
+        while __timeLoops(func, numLoops, setup) < gMicroBenchMinSampleTime:
+            numLoops *= 2
+
+    secPerOp = [__timeLoops(func, numLoops, setup)/numLoops for k in range(numSamples)]
+    return {'secPerOp':secPerOp, 'numLoops':numLoops, 'retainedObjectsPerOp':getRetainedObjectsPerOp(func, setup, numLoops)}
+
+def __timeLoops(func, numLoops, setup):
+    if setup!=None:
+        setup()
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        startTime = timeit.default_timer()
+        for k in xrange(numLoops):
+            func()
+        return timeit.default_timer()-startTime
+    finally:
+        if gcEnabled:
+            gc.enable()
+
+def getRetainedObjectsPerOp(func, setup, numLoops):
+    if setup!=None:
+        setup()
+    gc.collect()
+    numObjects = len(gc.get_objects())
+    for k in xrange(numLoops):
+        func()
+    gc.collect()
+    return float(len(gc.get_objects())-numObjects)/numLoops
+
+# distribution-free 95% confidence interval of the median by order statistics
+# return lower, upper
+def getMedianConfidenceInterval(values):
+    values = sorted(values)
+    n = len(values)
+    lowerRank = int(math.floor((n-1.96*math.sqrt(n))/2.))
+    upperRank = int(math.ceil(1+(n+1.96*math.sqrt(n))/2.))
+    return values[max(lowerRank, 1)-1], values[min(upperRank, n)-1]
+
+############################################
+# microbenchmark result functions
+# benchResult['micro']: {caseName:microResult}
+# benchResult['microCaseNames']: case names in the order of running
+
+def getOpsStr(secPerOp):
+    return '%.4g'%(1./secPerOp) if secPerOp > 0. else 'inf'
+
+def printMicroBenchSummary(benchResult):
+    print '%sMicrobenchmark summary (median ops/sec with 95%% confidence interval):'%gLogPrefix
+    print
+    print '%-36s %12s %25s %10s'%('Case', 'Ops/sec', '95% CI', 'Objs/op')
+    for name in benchResult['microCaseNames']:
+        microResult = benchResult['micro'][name]
+        lower, upper = getMedianConfidenceInterval(microResult['secPerOp'])
+        print '%-36s %12s %25s %10.2f'%(name, getOpsStr(getMedian(microResult['secPerOp'])),
+                '[%s, %s]'%(getOpsStr(upper), getOpsStr(lower)), microResult['retainedObjectsPerOp'])
+
+# a case is marked as a regression if it is slower than the old one by more than regressionThreshold (ratio)
+# and the confidence intervals of the old and new medians do not overlap.
+def printMicroBenchComparison(oldBenchResult, benchResult, regressionThreshold):
+    print '%sComparison with the previous result (%s, ops/sec):'%(gLogPrefix, oldBenchResult['date'])
+    print
+    print '%-36s %12s %12s %8s'%('Case', 'Old', 'New', 'Speedup')
+
+    numRegressions = 0
+    for name in benchResult['microCaseNames']:
+        if name not in oldBenchResult['micro']:
+            continue
+        oldSecPerOp = oldBenchResult['micro'][name]['secPerOp']
+        newSecPerOp = benchResult['micro'][name]['secPerOp']
+        ratio = getMedian(oldSecPerOp)/getMedian(newSecPerOp) if getMedian(newSecPerOp) > 0. else float('inf')
+        isRegression = ratio < 1./(1.+regressionThreshold) and \
+                getMedianConfidenceInterval(newSecPerOp)[0] > getMedianConfidenceInterval(oldSecPerOp)[1]
+        if isRegression:
+            numRegressions += 1
+        print '%-36s %12s %12s %7.2fx%s'%(name, getOpsStr(getMedian(oldSecPerOp)), getOpsStr(getMedian(newSecPerOp)),
+                ratio, ' (regression)' if isRegression else '')
+    print
+    print '%s%d regressions are found.'%(gLogPrefix, numRegressions)
+    return numRegressions
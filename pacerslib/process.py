@@ -16,14 +16,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import fnmatch
+import fnmatch, json
 from global_const import *
 from unicode import *
 from submission import *
 
 ############################################
 # main functions
-def collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir, exclude_patterns=[], user_input=[], destDir=None, deco2unicoMap=None, user_dict=None):
+def collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir, exclude_patterns=[], user_input=[], destDir=None, deco2unicoMap=None, user_dict=None, test_cases=None):
     allProjInfos = []
 
     # process each submission
@@ -35,11 +35,8 @@ def collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir, exclude
         # ex)
         # projNames : ['proj1', 'proj2']
         # projSrcFileNames: [['proj1.c','proj1.h'], ['proj2.c','proj2.h']]
+        # dest submission dirs have been already unidecoded by decodeAllDestSubmissionDirPaths()
         if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
-            if destDir!=None:
-                # unidecode destSubmissionDir
-                decodeDestSubmissionDirPathRecursive(destDir, submissionTitle, deco2unicoMap)
-
             if submissionType==SINGLE_SOURCE_FILE:
                 if destDir!=None:
                     submissionDir = destDir 
@@ -89,7 +86,6 @@ def collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir, exclude
 
             if submissionType==CMAKE_PROJECT:
                 if destDir!=None:
-                    decodeDestSubmissionDirPathRecursive(destDir, submissionTitle, deco2unicoMap)
                     submissionDir = opjoin(destDir, unico2decoPath(submissionTitle, deco2unicoMap))
                     projNames = [unico2decoPath(submissionTitle, deco2unicoMap)]    # ['student01']
                 else:
@@ -150,9 +146,14 @@ def collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir, exclude
             if user_dict!=None:
                 userInputs = getUserInputsFromUserDict(user_dict, projNames[i])
                 projInfo['userInputs'] = userInputs
+                projInfo['testCases'] = None
+            elif test_cases!=None:
+                projInfo['userInputs'] = [testCase['input'] for testCase in test_cases]
+                projInfo['testCases'] = test_cases
             else:
                 userInputs = user_input
                 projInfo['userInputs'] = userInputs
+                projInfo['testCases'] = None
 
             allProjInfos.append(projInfo)
 
@@ -161,11 +162,13 @@ def collectAllProjInfosInAllSubmissions(submissionTitles, assignmentDir, exclude
 def generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDir, args, deco2unicoMap):
     submittedFileNames = []
     srcFileLists = []
+    destSrcFileLists = []
     buildRetCodes = []
     buildLogs = []
     exitTypeLists = []
     stdoutStrLists = []
     userInputLists = []
+    testResultLists = []
     submissionTypes = []
     buildVersionSet = set()
 
@@ -178,15 +181,17 @@ def generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDi
 
         buildRetCode, buildLog, buildVersion = buildResults[i]
 
-        exitTypeList, stdoutStrList, userInputList = runResults[i]
+        exitTypeList, stdoutStrList, userInputList, testResultList = runResults[i]
 
         # add report data
         submittedFileNames.append(submissionTitle)
 
         # full path -> \hagsaeng01\munje2\munje2.c
         projOrigSrcFilePathsAfterAssignDir = []
+        projDestSrcFilePaths = []
         for srcFileName in filesInProj:
             destSrcFilePath = opjoin(submissionDir, srcFileName)
+            projDestSrcFilePaths.append(destSrcFilePath)
             destSrcFilePathAfterDestDir = destSrcFilePath.replace(destDir+os.sep, '')
 
             if args.run_only:
@@ -200,18 +205,47 @@ def generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDi
                 projOrigSrcFilePathsAfterAssignDir.append(opjoin(args.assignment_dir, origSrcFilePathAfterAssignDir))
 
         srcFileLists.append(projOrigSrcFilePathsAfterAssignDir)
+        destSrcFileLists.append(projDestSrcFilePaths)
         buildRetCodes.append(buildRetCode)
         buildLogs.append(buildLog)
         exitTypeLists.append(exitTypeList)
         stdoutStrLists.append(stdoutStrList)
         userInputLists.append(userInputList)
+        testResultLists.append(testResultList)
         submissionTypes.append(submissionType)
         buildVersionSet.add(buildVersion)
 
-    return submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, userInputLists, submissionTypes, buildVersionSet
+    return submittedFileNames, srcFileLists, destSrcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, userInputLists, testResultLists, submissionTypes, buildVersionSet
 
 ############################################
-# project type detection
+# unidecode dest submission paths
+def decodeAllDestSubmissionDirPaths(submissionTitles, assignmentDir, destDir, deco2unicoMap):
+    decodeSubmissionTitles = []
+    for submissionTitle in submissionTitles:
+        # No need to unidecode VISUAL_CPP_PROJECT, as MSVC compiler supports multibyte characters.
+        if detectSubmissionType(opjoin(assignmentDir, submissionTitle))!=VISUAL_CPP_PROJECT:
+            decodeSubmissionTitles.append(submissionTitle)
+
+    # register all names before renaming.
+    # names that are already decoded (e.g. ascii names) are registered first so that they keep their names
+    # and other names colliding with them get numbered suffixes.
+    names = set()
+    for submissionTitle in decodeSubmissionTitles:
+        names.add(submissionTitle)
+        # Convert paths for os.walk to byte string only for posix os (due to python bug?)
+        tempSubDir = opjoin(destDir, submissionTitle)
+        if os.name=='posix':
+            tempSubDir = toString(tempSubDir)
+        for root, dirs, files in os.walk(tempSubDir):
+            for name in dirs+files:
+                names.add(toUnicode(name))
+    names = sorted(names, key=lambda name: (getDecoToken(os.path.splitext(name)[0])!=os.path.splitext(name)[0], name))
+    for name in names:
+        unico2decoPath(name, deco2unicoMap)
+
+    for submissionTitle in decodeSubmissionTitles:
+        decodeDestSubmissionDirPathRecursive(destDir, submissionTitle, deco2unicoMap)
+
 def decodeDestSubmissionDirPathRecursive(destDir, submissionTitle, deco2unicoMap):
     origSubDir = opjoin(destDir, submissionTitle)
     newSubDir = opjoin(destDir, unico2decoPath(submissionTitle, deco2unicoMap))
@@ -227,27 +261,34 @@ def decodeDestSubmissionDirPathRecursive(destDir, submissionTitle, deco2unicoMap
         newSubDir = toString(newSubDir)
 
     for root, dirs, files in os.walk(newSubDir, topdown=False):
-        for name in dirs:
+        for name in dirs+files:
+            decoName = unico2decoPath(toUnicode(name), deco2unicoMap)
 
+            # Rename with the byte string name from os.walk only for posix os,
+            # because names not in the filesystem encoding (e.g. cp949 names extracted from zip files)
+            # cannot be encoded back from their unicode names.
             if os.name=='posix':
-                name = toUnicode(name)
-
-            decoName = unico2decoPath(name, deco2unicoMap)
+                decoName = toString(decoName)
             try:
-                os.rename(opjoin(root, name), opjoin(root, decoName))
+                os.rename(os.path.join(root, name), os.path.join(root, decoName))
             except:
                 pass
 
-        for name in files:
-            
-            if os.name=='posix':
-                name = toUnicode(name)
+def getDeco2unicoMapFilePath(destDir):
+    return opjoin(destDir, gDeco2unicoMapFileName)
 
-            decoName = unico2decoPath(name, deco2unicoMap)
-            try:
-                os.rename(opjoin(root, name), opjoin(root, decoName))
-            except:
-                pass
+def saveDeco2unicoMap(destDir, deco2unicoMap):
+    with open(toString(getDeco2unicoMapFilePath(destDir)), 'w') as f:
+        json.dump(deco2unicoMap, f, indent=0, sort_keys=True)
+
+# return True if the map saved by saveDeco2unicoMap() is loaded into deco2unicoMap
+def loadDeco2unicoMap(destDir, deco2unicoMap):
+    try:
+        with open(toString(getDeco2unicoMapFilePath(destDir)), 'r') as f:
+            deco2unicoMap.update(json.load(f))
+    except (IOError, ValueError):
+        return False
+    return True
 
 def getUserInputsFromUserDict(userDict, projName):
     userInputs = None
@@ -0,0 +1,184 @@
+################################################################################
+# reference.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, shutil, hashlib
+from global_const import *
+from unicode import *
+from submission import *
+from process import *
+from build import *
+from run import *
+
+############################################
+# reference solution functions
+# A reference solution (a source file or a project dir) is built and run in the same way as submissions,
+# and its outputs are used as expected outputs of all submissions.
+# Outputs are cached in gReferenceCacheDirName in output_dir, keyed by the hash of the reference sources
+# and each user input, so the reference is run only for inputs that have not been run before.
+# Outputs are cached as the raw byte strings written by the reference, as outputs of submissions are compared
+# with them before being decoded (see checkOutputStream()).
+# gReferenceCacheVersion should be increased whenever the format of cached outputs changes.
+gReferenceCacheVersion = 2
+
+# return testCases (see loadTestCases()) whose expected outputs are the outputs of the reference solution.
+# if testCases is None, a test case is made for each of userInputs.
+# otherwise, expected outputs of test cases without NAME.out are filled with outputs of the reference solution.
+def getReferenceTestCases(referencePath, userInputs, testCases, output_dir, timeOut):
+    if testCases==None:
+        testCases = [{'name':userInput, 'input':userInput, 'expectedOutput':None} for userInput in userInputs]
+    else:
+        testCases = [dict(testCase) for testCase in testCases]
+
+    referenceHash = getReferenceHash(referencePath)
+    outputDir = opjoin(getReferenceCacheDir(output_dir, referenceHash), 'outputs')
+
+    # read cached outputs
+    numCachedTestCases = 0
+    uncachedTestCases = []
+    for testCase in testCases:
+        if testCase['expectedOutput']!=None:
+            continue
+        testCase['expectedOutput'] = readReferenceOutput(getReferenceOutputPath(outputDir, testCase['input']))
+        if testCase['expectedOutput']==None:
+            uncachedTestCases.append(testCase)
+        else:
+            numCachedTestCases += 1
+
+    print '%sReference solution: %d outputs are cached, %d inputs should be run.'%(gLogPrefix,
+            numCachedTestCases, len(uncachedTestCases))
+
+    if len(uncachedTestCases) > 0:
+        # inputs that have the same content are run only once
+        uncachedInputs = []
+        for testCase in uncachedTestCases:
+            if testCase['input'] not in uncachedInputs:
+                uncachedInputs.append(testCase['input'])
+
+        outputs = runReference(referencePath, referenceHash, uncachedInputs, output_dir, timeOut)
+        for testCase in uncachedTestCases:
+            testCase['expectedOutput'] = outputs[uncachedInputs.index(testCase['input'])]
+        for userInput, output in zip(uncachedInputs, outputs):
+            if output!=None:
+                writeReferenceOutput(getReferenceOutputPath(outputDir, userInput), output)
+
+    return testCases
+
+# build the reference solution in the reference cache dir and run it with userInputs.
+# return outputs as raw byte strings (None for each failed run)
+def runReference(referencePath, referenceHash, userInputs, output_dir, timeOut):
+    # copy the reference to a clean dir, as builds should start from the sources only
+    referenceDir = opjoin(getReferenceCacheDir(output_dir, referenceHash), 'reference')
+    referenceTitle = unico2decoPath(os.path.basename(os.path.abspath(toUnicode(referencePath))), {'':''})
+    destReferencePath = opjoin(referenceDir, referenceTitle)
+
+    # Convert paths for shutil to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        tempSrcPath = toString(referencePath)
+        tempReferenceDir = toString(referenceDir)
+        tempDestPath = toString(destReferencePath)
+    else:
+        tempSrcPath = referencePath
+        tempReferenceDir = referenceDir
+        tempDestPath = destReferencePath
+    if os.path.exists(tempReferenceDir):
+        shutil.rmtree(tempReferenceDir)
+    os.makedirs(tempReferenceDir)
+    if os.path.isdir(tempSrcPath):
+        shutil.copytree(tempSrcPath, tempDestPath)
+    else:
+        shutil.copy(tempSrcPath, tempDestPath)
+
+    projInfos = collectAllProjInfosInAllSubmissions([referenceTitle], referenceDir, user_input=userInputs)
+    if len(projInfos)!=1:
+        print '%sReference solution: %s should have a single project, but has %d projects.'%(gLogPrefix, referencePath, len(projInfos))
+        return [None]*len(userInputs)
+    projInfo = projInfos[0]
+
+    print '%sReference solution: Building %s...'%(gLogPrefix, referencePath)
+    buildRetCode, buildLog, buildVersion = buildOneProj(projInfo)
+    if buildRetCode!=0:
+        print '%sReference solution: Build failed.'%gLogPrefix
+        print buildLog
+        return [None]*len(userInputs)
+
+    print '%sReference solution: Running %d inputs...'%(gLogPrefix, len(userInputs))
+    exitTypeList, stdoutStrList, userInputList, testResultList = runOneProj(projInfo, timeOut, rawOutput=True)
+
+    outputs = []
+    for i in range(len(userInputs)):
+        if exitTypeList[i]==0:
+            outputs.append(stdoutStrList[i])
+        else:
+            print '%sReference solution: Execution failed with user input %s.'%(gLogPrefix, repr(userInputs[i]))
+            outputs.append(None)
+    return outputs
+
+def getReferenceCacheDir(output_dir, referenceHash):
+    return opjoin(opjoin(output_dir, gReferenceCacheDirName), referenceHash)
+
+def getReferenceOutputPath(outputDir, userInput):
+    if isinstance(userInput, unicode):
+        userInput = userInput.encode('utf-8')
+    return opjoin(outputDir, hashlib.sha1(userInput).hexdigest()+'.out')
+
+# hash of relative paths and contents of all source files of the reference solution
+def getReferenceHash(referencePath):
+    h = hashlib.sha1()
+    h.update('%d:'%gReferenceCacheVersion)
+    # Convert paths for os.walk to byte string only for posix os (due to python bug?)
+    if os.name=='posix':
+        referencePath = toString(referencePath)
+    referencePath = os.path.abspath(referencePath)
+    if os.path.isdir(referencePath):
+        filePaths = []
+        for root, dirs, files in os.walk(referencePath):
+            dirs[:] = [name for name in dirs if not name.startswith(gBuildDirPrefix)]
+            for name in files:
+                filePaths.append(os.path.join(root, name))
+        filePaths.sort()
+    else:
+        filePaths = [referencePath]
+
+    for filePath in filePaths:
+        relPath = os.path.relpath(filePath, os.path.dirname(referencePath))
+        if isinstance(relPath, unicode):
+            relPath = relPath.encode('utf-8')
+        with open(filePath, 'rb') as f:
+            content = f.read()
+        h.update('%d:%s%d:'%(len(relPath), relPath, len(content)))
+        h.update(content)
+    return h.hexdigest()
+
+def readReferenceOutput(outputPath):
+    try:
+        with open(outputPath, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+def writeReferenceOutput(outputPath, output):
+    try:
+        outputDir = os.path.dirname(outputPath)
+        if not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+        tempPath = '%s.%d.tmp'%(outputPath, os.getpid())
+        with open(tempPath, 'wb') as f:
+            f.write(output)
+        os.rename(tempPath, outputPath)
+    except (IOError, OSError) as e:
+        print '%sCannot write cache file %s - %s'%(gLogPrefix, outputPath, e)
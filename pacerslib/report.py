@@ -16,17 +16,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import os, platform, urllib, shutil
+import os, platform, urllib, shutil, codecs, itertools, hashlib, collections, math, cgi, re
+import multiprocessing as mp
 import pygments
 from pygments import highlight
-from pygments.lexers import guess_lexer_for_filename
+from pygments.lexers import guess_lexer_for_filename, get_lexer_by_name
 from pygments.formatters import HtmlFormatter
-from pygments.lexers.special import TextLexer
 from global_const import *
+from timing import *
 
 ############################################
 # report functions
-def generateReport(args, submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, userInputLists, submissionTypes, buildVersionSet):
+def generateReport(args, submittedFileNames, srcFileLists, destSrcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, userInputLists, testResultLists, submissionTypes, buildVersionSet, similarPairs=None):
 
     cssCode = HtmlFormatter().get_style_defs()
 
@@ -102,10 +103,12 @@ table.type04 td {
 }
 '''
 
-    htmlCode = u''
+    # write html code to the report file as soon as each part is rendered,
+    # so that only a single table row is kept in memory at a time.
+    with codecs.open(getReportFilePath(args), 'w', 'utf-8') as f:
 
-    # header
-    htmlCode += '''<html>
+        # header
+        f.write('''<html>
     <head>
     <title>%s - PACERs Assignment Report</title>
     <style type="text/css">
@@ -113,29 +116,29 @@ table.type04 td {
     </style>
     </head>
     <body>
-    <h2>%s - PACERs Assignment Report</h2>'''%(args.assignment_alias, cssCode, args.assignment_alias)
+    <h2>%s - PACERs Assignment Report</h2>'''%(args.assignment_alias, cssCode, args.assignment_alias))
 
-    # system information
-    htmlCode += '''<table class="type04">
+        # system information
+        f.write('''<table class="type04">
     <thead>
     <tr><th colspan=2>System Information</th></tr>
     </thead>
 
     <tbody>
-    <tr><th>Operating system</th> <td>%s</td></tr>'''%(platform.platform())
+    <tr><th>Operating system</th> <td>%s</td></tr>'''%(platform.platform()))
 
-    for buildVersion in buildVersionSet:
-        if buildVersion != 'no-build-version':
-            htmlCode +='<tr><th>%s</th><td>'%gVersionDescription[buildVersion]
-            for versionText in eval(gOSEnv[os.name][buildVersion])():
-                htmlCode +='%s<br>'%versionText
-            htmlCode +='</td></tr>'
+        for buildVersion in buildVersionSet:
+            if buildVersion != 'no-build-version':
+                f.write('<tr><th>%s</th><td>'%gVersionDescription[buildVersion])
+                for versionText in eval(gOSEnv[os.name][buildVersion])():
+                    f.write('%s<br>'%versionText)
+                f.write('</td></tr>')
 
-    htmlCode += '''</tbody>
-    </table>'''
+        f.write('''</tbody>
+    </table>''')
 
-    # pacers options
-    htmlCode += '''<table class="type04">
+        # pacers options
+        f.write('''<table class="type04">
     <thead>
     <tr><th colspan=2>PACERs Options</th></tr>
     </thead>
@@ -145,15 +148,28 @@ table.type04 td {
     <tr><th>Output directory</th> <td>%s</td></tr>
     <tr><th>User input</th> <td>%s</td></tr>
     <!--<tr><th>User dict</th> <td>%s</td></tr>-->
+    <tr><th>Test cases</th> <td>%s</td></tr>
+    <tr><th>Reference solution</th> <td>%s</td></tr>
+    <tr><th>Compare mode</th> <td>%s</td></tr>
     <tr><th>Timeout</th> <td>%f</td></tr>
+    <tr><th>Timeout clock</th> <td>%s</td></tr>
+    <tr><th>Early abort</th> <td>%s</td></tr>
     <tr><th>Run only</th> <td>%s</td></tr>
     <tr><th>Build only</th> <td>%s</td></tr>
     </tbody>
     </table>'''%(os.path.abspath(args.assignment_dir), opjoin(os.path.abspath(args.output_dir), unidecode(args.assignment_alias)), 
-        args.user_input, args.user_dict, args.timeout, 'true' if args.run_only else 'false', 'true' if args.build_only else 'false')
-
-    # main table
-    htmlCode += '''
+            args.user_input, args.user_dict, os.path.abspath(args.test_cases) if args.test_cases!=None else 'none',
+            os.path.abspath(args.reference) if args.reference!=None else 'none',
+            args.compare_mode if args.compare_mode!='float' else 'float (tolerance: %g)'%args.float_tolerance, args.timeout, args.timeout_clock,
+            getEarlyAbortStr(args), 'true' if args.run_only else 'false', 'true' if args.build_only else 'false'))
+
+        # similar submissions
+        if similarPairs!=None:
+            f.write(getSimilarityTable(similarPairs))
+
+        # main table
+        if not args.sharded_report:
+            f.write('''
     <!--'Source Files' means the relative path of each source file from the assignment directory.-->
     <table class="type08">
     <thead>
@@ -164,119 +180,630 @@ table.type04 td {
     <th>Score</th>
     <th>Comment</th>
     </tr>
-    </thead>'''
+    </thead>''')
+        else:
+            # source files and outputs of each row are written to a separate page in the report resource dir,
+            # which is loaded in an iframe only when the row is expanded.
+            resourceDir = getReportResourceDir(args.output_dir, args.assignment_alias)
+            if not os.path.isdir(resourceDir):
+                os.makedirs(resourceDir)
+            with codecs.open(opjoin(resourceDir, 'report.css'), 'w', 'utf-8') as cssFile:
+                cssFile.write(cssCode)
+
+            f.write('''
+    <script>
+    function loadShard(details) {
+        var iframe = details.getElementsByTagName('iframe')[0];
+        if (details.open && !iframe.getAttribute('src'))
+            iframe.setAttribute('src', iframe.getAttribute('data-src'));
+    }
+    </script>
+    <!--'Source Files' means the relative path of each source file from the assignment directory.-->
+    <table class="type08">
+    <thead>
+    <tr>
+    <th>Submission Title<br>(Submission Type)</th>
+    <th>Summary</th>
+    <th>Source Files & Output</th>
+    <th>Score</th>
+    <th>Comment</th>
+    </tr>
+    </thead>''')
+
+        f.write('<tbody>\n')
+
+        # rows with the same outputs are grouped, and the outputs of each group are rendered only in its first row.
+        outputGroupIndices, outputGroups = getOutputGroups(buildRetCodes, userInputLists, exitTypeLists, stdoutStrLists, testResultLists)
+        reportFileUrl = urllib.pathname2url(os.path.basename(getReportFilePath(args)).encode('utf-8'))
+
+        # source tables and outputs are highlighted by worker processes, and the parent process
+        # only writes the rendered rows in order.
+        renderParams = []
+        for i in range(len(submittedFileNames)):
+            renderOutput = outputGroupIndices[i]==None or outputGroups[outputGroupIndices[i]][0]==i
+            renderParams.append((srcFileLists[i], destSrcFileLists[i], args.assignment_dir, args.output_dir, args.assignment_alias,
+                buildRetCodes[i], buildLogs[i], userInputLists[i], exitTypeLists[i], stdoutStrLists[i] if renderOutput else None, testResultLists[i]))
+        if not args.report_serial:
+            p = mp.Pool(args.num_cores)
+            renderedRows = p.imap(worker_render, renderParams)
+        else:
+            renderedRows = itertools.imap(worker_render, renderParams)
+
+        usedFragmentNames = set()
+        usedHighlightKeys = set()
+        usedShardNames = set()
+        for i, (sourcesTable, output, fragmentNames) in enumerate(renderedRows):
+            usedFragmentNames.update(fragmentNames)
+            usedHighlightKeys.update(getHighlightKeys(sourcesTable))
+            if outputGroupIndices[i]!=None:
+                output = getOutputGroupHeader(i, outputGroupIndices[i], outputGroups, submittedFileNames, reportFileUrl) + (output if output!=None else '')
+            if not args.sharded_report:
+                f.write(getReportRow(i, submittedFileNames[i], submissionTypes[i], sourcesTable, output))
+            else:
+                shardName = writeReportShard(resourceDir, i, submittedFileNames[i], sourcesTable, output)
+                usedShardNames.add(shardName)
+                f.write(getShardedReportRow(i, submittedFileNames[i], submissionTypes[i],
+                    getRowSummary(srcFileLists[i], buildRetCodes[i], exitTypeLists[i], testResultLists[i], outputGroupIndices[i]),
+                    urllib.pathname2url(opjoin(os.path.basename(resourceDir), shardName).encode('utf-8'))))
+
+        if not args.report_serial:
+            p.close()
+            p.join()
+
+        removeUnusedRowFragments(getRowFragmentDir(args.output_dir, args.assignment_alias), usedFragmentNames)
+        removeUnusedHighlightCache(getHighlightCacheDir(args.output_dir, args.assignment_alias), usedHighlightKeys)
+        removeUnusedReportShards(getReportResourceDir(args.output_dir, args.assignment_alias), usedShardNames)
+
+        f.write('</tbody>\n')
+        f.write('</table>\n')
+
+        # footer
+        f.write('''</body>
+    </html>''')
 
-    htmlCode += '<tbody>\n'
+############################################
+# multi processing worker functions
+def worker_render(params):
+    srcFileList, destSrcFileList, assignment_dir, output_dir, assignment_alias, buildRetCode, buildLog, userInputList, exitTypeList, stdoutStrList, testResultList = params
+    fragmentDir = getRowFragmentDir(output_dir, assignment_alias)
+
+    # stdoutStrList is None if the outputs are rendered in another row of the same output group
+    sourcesFragmentName = 'src-%s.html'%getSourcesTableFingerprint(srcFileList, destSrcFileList, assignment_dir, output_dir, assignment_alias)
+    sourcesTable = getRowFragment(fragmentDir, sourcesFragmentName,
+            getSourcesTable, (srcFileList, destSrcFileList, assignment_dir, output_dir, assignment_alias))
+
+    if stdoutStrList==None:
+        return sourcesTable, None, [sourcesFragmentName]
+
+    outputFragmentName = 'out-%s.html'%getOutputFingerprint(buildRetCode, buildLog, userInputList, exitTypeList, stdoutStrList, testResultList)
+    output = getRowFragment(fragmentDir, outputFragmentName,
+            getOutput, (buildRetCode, buildLog, userInputList, exitTypeList, stdoutStrList, testResultList))
+
+    return sourcesTable, output, [sourcesFragmentName, outputFragmentName]
+
+def getReportRow(rowIndex, submittedFileName, submissionType, sourcesTable, output):
+    htmlCodes = []
+    htmlCodes.append('<tr id="%s">\n'%getRowId(rowIndex))
+    htmlCodes.append('<th>%s<br>(%s)</th>\n'%(submittedFileName, gSubmissionTypeName[submissionType]))
+    htmlCodes.append('<td>%s</td>\n'%sourcesTable)
+    htmlCodes.append('<td>%s</td>\n'%output)
+    htmlCodes.append('<td>%s</td>\n'%'')
+    htmlCodes.append('<td>%s</td>\n'%'')
+    htmlCodes.append('</tr>\n')
+    return ''.join(htmlCodes)
+
+def getRowId(rowIndex):
+    return 'row-%d'%rowIndex
 
-    for i in range(len(submittedFileNames)):
-        htmlCode += '<tr>\n'
-        htmlCode += '<th>%s<br>(%s)</th>\n'%(submittedFileNames[i], gSubmissionTypeName[submissionTypes[i]])
-        htmlCode += '<td>%s</td>\n'%getSourcesTable(srcFileLists[i], args.assignment_dir, args.output_dir, args.assignment_alias)
-        htmlCode += '<td>%s</td>\n'%getOutput(buildRetCodes[i], buildLogs[i], userInputLists[i], exitTypeLists[i], stdoutStrLists[i])
-        htmlCode += '<td>%s</td>\n'%''
-        htmlCode += '<td>%s</td>\n'%''
-        htmlCode += '</tr>\n'
+############################################
+# output groups
+# Many submissions produce exactly the same outputs for all user inputs. Such rows are grouped by the
+# signature of their outputs, so that the outputs are rendered once and the whole group can be scored at a time.
+
+# return outputGroupIndices, outputGroups
+# outputGroupIndices - index of the output group of each row, or None if the row is not grouped
+# outputGroups - list of row indices of each group (having at least 2 rows)
+def getOutputGroups(buildRetCodes, userInputLists, exitTypeLists, stdoutStrLists, testResultLists):
+    rowIndicesOfSignature = collections.OrderedDict()
+    for i in range(len(buildRetCodes)):
+        # rows that have not been built or run have nothing to be grouped, and
+        # outputs of programs killed due to timeout depend on the timing (and can be very long).
+        if buildRetCodes[i]!=0 or exitTypeLists[i].count(-1)==len(exitTypeLists[i]) or 1 in exitTypeLists[i]:
+            continue
+        signature = getOutputSignature(userInputLists[i], exitTypeLists[i], stdoutStrLists[i], testResultLists[i])
+        rowIndicesOfSignature.setdefault(signature, []).append(i)
+
+    outputGroupIndices = [None]*len(buildRetCodes)
+    outputGroups = []
+    for rowIndices in rowIndicesOfSignature.itervalues():
+        if len(rowIndices) < 2:
+            continue
+        for i in rowIndices:
+            outputGroupIndices[i] = len(outputGroups)
+        outputGroups.append(rowIndices)
+    return outputGroupIndices, outputGroups
+
+# outputs are compared after removing trailing whitespaces of each line and trailing empty lines.
+# test results are also compared, as test cases may be checked with whitespaces.
+gTrailingWhitespacesPattern = re.compile(u'[ \t\r\f\v]+$', re.M)
+
+def getOutputSignature(userInputList, exitTypeList, stdoutStrList, testResultList):
+    values = [userInputList, exitTypeList, [testResult[:2] if testResult!=None else None for testResult in testResultList]]
+    for stdoutStr in stdoutStrList:
+        values.append(gTrailingWhitespacesPattern.sub(u'', stdoutStr).rstrip(u'\n'))
+    return getFingerprint(values)
+
+def getOutputGroupHeader(rowIndex, outputGroupIndex, outputGroups, submittedFileNames, reportFileUrl):
+    rowIndices = outputGroups[outputGroupIndex]
+    # links have the report file name, as they are also used in sharded report pages
+    links = ['<a href="%s#%s" target="_top">%s</a>'%(reportFileUrl, getRowId(i), submittedFileNames[i]) for i in rowIndices if i!=rowIndex]
+    if rowIndices[0]==rowIndex:
+        return '<p><b>Output group %d</b> - %d submissions have the same output: %s</p>\n'%(
+                outputGroupIndex+1, len(rowIndices), ', '.join(links))
+    else:
+        return '<p><b>Output group %d</b> - Same output as %s (shown there).</p>\n'%(
+                outputGroupIndex+1, links[0])
 
-    htmlCode += '</tbody>\n'
-    htmlCode += '</table>\n'
+############################################
+# similarity table
+# similarPairs - see getSimilarPairs() in similarity.py
+def getSimilarityTable(similarPairs):
+    htmlCodes = []
+    htmlCodes.append('''<table class="type04">
+    <thead>
+    <tr><th colspan=5>Similar Submissions</th></tr>
+    <tr><th>Rank</th><th>Submission 1</th><th>Submission 2</th><th>Similarity</th><th>Shared Fingerprints</th></tr>
+    </thead>
+    <tbody>''')
+    if len(similarPairs)==0:
+        htmlCodes.append('<tr><td colspan=5>No similar submissions are found.</td></tr>')
+    for rank, (projIndex1, projIndex2, label1, label2, similarity, numShared) in enumerate(similarPairs):
+        htmlCodes.append('<tr><td>%d</td><td><a href="#%s">%s</a></td><td><a href="#%s">%s</a></td><td>%.1f%%</td><td>%d</td></tr>\n'%(
+            rank+1, getRowId(projIndex1), cgi.escape(label1), getRowId(projIndex2), cgi.escape(label2), similarity*100., numShared))
+    htmlCodes.append('''</tbody>
+    </table>''')
+    return ''.join(htmlCodes)
 
-    # footer
-    htmlCode += '''</body>
-    </html>'''
+############################################
+# sharded report functions
+def getShardedReportRow(rowIndex, submittedFileName, submissionType, summary, shardUrl):
+    htmlCodes = []
+    htmlCodes.append('<tr id="%s">\n'%getRowId(rowIndex))
+    htmlCodes.append('<th>%s<br>(%s)</th>\n'%(submittedFileName, gSubmissionTypeName[submissionType]))
+    htmlCodes.append('<td>%s</td>\n'%summary)
+    htmlCodes.append('<td><details ontoggle="loadShard(this)"><summary>Show</summary>'
+            '<iframe data-src="%s" style="width:900px;height:600px;border:0;resize:both"></iframe></details></td>\n'%shardUrl)
+    htmlCodes.append('<td>%s</td>\n'%'')
+    htmlCodes.append('<td>%s</td>\n'%'')
+    htmlCodes.append('</tr>\n')
+    return ''.join(htmlCodes)
+
+def getRowSummary(srcFileList, buildRetCode, exitTypeList, testResultList, outputGroupIndex=None):
+    summary = '%d source files<br>'%len(srcFileList)
+    if buildRetCode!=0:
+        summary += 'Build failed'
+    else:
+        summary += 'Terminated: %d<br>'%exitTypeList.count(0)
+        summary += 'Timeout: %d<br>'%exitTypeList.count(1)
+        summary += 'Failed: %d'%exitTypeList.count(-1)
+        if 2 in exitTypeList:
+            summary += '<br>Skipped: %d'%exitTypeList.count(2)
+        numTests, numPassedTests = getNumTests(testResultList)
+        if numTests > 0:
+            summary += '<br>Tests passed: %d/%d'%(numPassedTests, numTests)
+        if outputGroupIndex!=None:
+            summary += '<br>Output group %d'%(outputGroupIndex+1)
+    return summary
+
+# write a page with the source files and outputs of a row, and return its file name
+def writeReportShard(resourceDir, rowIndex, submittedFileName, sourcesTable, output):
+    shardName = 'row-%d.html'%rowIndex
+    with codecs.open(opjoin(resourceDir, shardName), 'w', 'utf-8') as f:
+        # relative paths (e.g. images) in sourcesTable are relative to the index report file
+        f.write('''<html>
+    <head>
+    <base href="../">
+    <title>%s</title>
+    <link rel="stylesheet" type="text/css" href="%s">
+    </head>
+    <body>
+    <table class="type08">
+    <thead>
+    <tr>
+    <th>Source Files</th>
+    <th>Output</th>
+    </tr>
+    </thead>
+    <tbody>
+    <tr>
+    <td>%s</td>
+    <td>%s</td>
+    </tr>
+    </tbody>
+    </table>
+    </body>
+    </html>'''%(submittedFileName, urllib.pathname2url(opjoin(os.path.basename(resourceDir), 'report.css').encode('utf-8')), sourcesTable, output))
+    return shardName
+
+# remove pages of rows not in the current report (e.g. written by a previous run with more submissions)
+def removeUnusedReportShards(resourceDir, usedShardNames):
+    if not os.path.isdir(resourceDir):
+        return
+    for name in os.listdir(resourceDir):
+        if re.match(r'row-\d+\.html$', name) and name not in usedShardNames:
+            try:
+                os.remove(opjoin(resourceDir, name))
+            except OSError:
+                pass
 
-    # write html
-    with open(getReportFilePath(args), 'w') as f:
-        f.write(htmlCode.encode('utf-8'))
-        
 def getReportFilePath(args):
     return opjoin(opjoin(args.output_dir, unidecode(args.assignment_alias)),'report-%s.html'%args.assignment_alias)
 
 def getReportResourceDir(output_dir, assignment_alias):
     return opjoin(opjoin(output_dir, unidecode(assignment_alias)),'report-%s'%assignment_alias)
 
-def getSourcesTable(srcPaths, assignment_dir, output_dir, assignment_alias):
+# srcPaths - source file paths to be shown in the report
+# destSrcPaths - paths of the copied source files in output_dir to be read
+def getSourcesTable(srcPaths, destSrcPaths, assignment_dir, output_dir, assignment_alias):
     renderedSrcPaths = []
     renderedSource = []
     failedMsgSrcPathMap = {}
 
-    for srcPath in srcPaths:
-        success, text = getRenderedSource(srcPath, output_dir, assignment_alias)
+    for i in range(len(srcPaths)):
+        srcPath = srcPaths[i]
+        success, text = getRenderedSource(srcPath, destSrcPaths[i], output_dir, assignment_alias)
         if success:
             renderedSrcPaths.append(srcPath)
             renderedSource.append(text)
         else:
             if text not in failedMsgSrcPathMap:
                 failedMsgSrcPathMap[text] = []
-            failedMsgSrcPathMap[text].append(srcPath)
+            failedMsgSrcPathMap[text].append('%s (%s)'%(srcPath.replace(assignment_dir, ''), getFileSizeStr(destSrcPaths[i])))
 
-    htmlCode = ''
+    htmlCodes = []
 
     # add rendered source file text
     for i in range(len(renderedSrcPaths)):
-        htmlCode += '<b>%s</b>'%renderedSrcPaths[i].replace(assignment_dir, '')
-        htmlCode += '%s'%renderedSource[i]
+        htmlCodes.append('<b>%s</b>'%renderedSrcPaths[i].replace(assignment_dir, ''))
+        htmlCodes.append('%s'%renderedSource[i])
 
     # add failed source file paths
     for errorMsg in failedMsgSrcPathMap:
-        htmlCode += '<b>%s</b><br></br>'%errorMsg
-        for failedSrcPath in failedMsgSrcPathMap[errorMsg]:
-            htmlCode += '%s<br></br>'%failedSrcPath.replace(assignment_dir, '')
+        htmlCodes.append('<b>%s</b><br></br>'%errorMsg)
+        for failedSrcPathStr in failedMsgSrcPathMap[errorMsg]:
+            htmlCodes.append('%s<br></br>'%failedSrcPathStr)
 
-    return htmlCode 
+    return ''.join(htmlCodes)
 
-def getRenderedSource(srcPath, output_dir, assignment_alias):
+# Binary and oversized files are detected from their sizes and first blocks, and other sources are
+# decoded only if their highlighted html is not in the highlight cache.
+def getRenderedSource(srcPath, destSrcPath, output_dir, assignment_alias):
     IMG_EXTS = ['.jpg', '.jpeg', '.gif', '.png', '.bmp']
     if os.path.splitext(srcPath)[1].lower() in IMG_EXTS:
         resourceDir = getReportResourceDir(output_dir, assignment_alias)
         if not os.path.isdir(resourceDir):
-            os.makedirs(resourceDir)
-        shutil.copy(srcPath, resourceDir)
-        newImgPath = opjoin(os.path.basename(resourceDir), os.path.basename(srcPath))
+            # resourceDir may be made by another worker process at the same time
+            try:
+                os.makedirs(resourceDir)
+            except OSError:
+                if not os.path.isdir(resourceDir):
+                    raise
+        imgName = addReportImage(destSrcPath, resourceDir)
+        newImgPath = opjoin(os.path.basename(resourceDir), imgName)
         newImgPath = urllib.pathname2url(newImgPath.encode('utf-8'))
         return True, u'<p></p><img src="%s">'%newImgPath
     else:
-        with open(srcPath, 'r') as f:
-            sourceCode = f.read()
-            sourceCode = toUnicode(sourceCode)
+        with open(destSrcPath, 'rb') as f:
+            fileSize = os.fstat(f.fileno()).st_size
+            if fileSize > gReportMaxSourceSize:
+                return False, 'Files too large to be shown:'
+
+            # check only the first block to avoid reading whole binary files
+            sourceBytes = f.read(gReportBinarySniffSize)
+            if isBinaryBlock(sourceBytes):
+                return False, 'Binary files not shown:'
+
+            isTruncated = fileSize > gReportTruncatedSourceSize
+            if isTruncated:
+                sourceBytes += f.read(gReportTruncatedSourceSize-len(sourceBytes))
+                # do not cut a line (and a multibyte character) in the middle
+                if '\n' in sourceBytes:
+                    sourceBytes = sourceBytes[:sourceBytes.rindex('\n')+1]
+            else:
+                sourceBytes += f.read()
+
+        try:
+            with profileSpan('highlight', 'report', {'file':srcPath}):
+                htmlCode = highlightWithCache(sourceBytes, srcPath, output_dir, assignment_alias)
+        except pygments.util.ClassNotFound as e:
+            return False, 'No lexer found for:'
+        if isTruncated:
+            htmlCode += '<p><i>(Truncated. Only the first %s of %s are shown.)</i></p>'%(getSizeStr(len(sourceBytes)), getSizeStr(fileSize))
+        return True, htmlCode
+
+# Images are stored in resourceDir with their content hashes as file names, so identical images
+# (e.g. the same screenshot in many submissions) are stored once and same-named images do not overwrite each other.
+# return the image file name in resourceDir
+def addReportImage(imgPath, resourceDir):
+    h = hashlib.sha1()
+    with open(imgPath, 'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), ''):
+            h.update(block)
+    imgName = h.hexdigest()+os.path.splitext(imgPath)[1].lower()
+    newImgPath = opjoin(resourceDir, imgName)
+
+    if not os.path.exists(newImgPath):
+        # hardlink if possible, as the copied source file in output_dir has the same content.
+        # link or copy to a temporary file first, as other worker processes may add the same image at the same time
+        tempPath = '%s.%d.tmp'%(newImgPath, os.getpid())
+        try:
+            os.link(imgPath, tempPath)
+        except (OSError, AttributeError):
+            shutil.copy(imgPath, tempPath)
+        os.rename(tempPath, newImgPath)
+    return imgName
+
+# a block is regarded as binary if it has a NUL byte, or its byte entropy is as high as compressed data.
+def isBinaryBlock(block):
+    if '\0' in block:
+        return True
+    if len(block)==0:
+        return False
+
+    entropy = 0.
+    for count in collections.Counter(block).itervalues():
+        p = float(count)/len(block)
+        entropy -= p*math.log(p, 2)
+    return entropy > 7.5
+
+def getFileSizeStr(filePath):
+    try:
+        return getSizeStr(os.path.getsize(filePath))
+    except OSError:
+        return 'unknown size'
+
+def getSizeStr(numBytes):
+    if numBytes < 1024:
+        return '%d bytes'%numBytes
+    elif numBytes < 1024*1024:
+        return '%.1f KB'%(numBytes/1024.)
+    else:
+        return '%.1f MB'%(numBytes/1024./1024.)
+
+# lexer instances for each alias in gLexerAliases
+gLexers = {}
+
+def getLexer(srcPath, sourceCode):
+    alias = getLexerAlias(srcPath)
+    if alias==None:
+        # guess_lexer_for_filename() scans all lexers and may run their analyse_text() over sourceCode,
+        # so it is used only for unknown extensions.
+        return guess_lexer_for_filename(srcPath, sourceCode)
+
+    if alias not in gLexers:
+        gLexers[alias] = get_lexer_by_name(alias)
+    return gLexers[alias]
+
+# return the lexer alias selected by the file name or extension, or None if the lexer should be guessed
+def getLexerAlias(srcPath):
+    fileName = os.path.basename(srcPath)
+    ext = os.path.splitext(fileName)[1].lower()
+    if fileName in gLexerAliases:
+        return gLexerAliases[fileName]
+    return gLexerAliases.get(ext)
+
+############################################
+# highlight cache
+# Rendered html of each source file is stored in gHighlightCacheDirName/ASSIGNMENT_ALIAS in output_dir,
+# keyed by the hash of the file content, the lexer selected by the file name and the pygments version,
+# so unchanged sources are not highlighted again when the report is regenerated (e.g. after the row fragments
+# are removed with the copied submissions).
+# The key is made without decoding the source, which is decoded (by detecting its encoding from a bounded sample
+# like program outputs) and lexed only on a cache miss.
+# The returned html starts with a comment having the key, so that the keys used by a report can be collected
+# from its sources tables (even from stored row fragments), and entries not used by the report are removed.
+def getHighlightCacheDir(output_dir, assignment_alias):
+    return opjoin(opjoin(output_dir, gHighlightCacheDirName), unidecode(assignment_alias))
+
+# raise pygments.util.ClassNotFound if no lexer is found for srcPath
+def highlightWithCache(sourceBytes, srcPath, output_dir, assignment_alias):
+    # the guessed lexer depends on the file name as well as the content
+    lexerName = getLexerAlias(srcPath)
+    if lexerName==None:
+        lexerName = u'guess:'+toUnicode(os.path.basename(srcPath))
+    key = hashlib.sha1('%s %s %s'%(hashlib.sha1(sourceBytes).hexdigest(), lexerName.encode('utf-8'), pygments.__version__)).hexdigest()
+    cacheDir = getHighlightCacheDir(output_dir, assignment_alias)
+    cachePath = opjoin(cacheDir, key+'.html')
+
+    htmlCode = readCacheFile(cachePath)
+    if htmlCode==None:
+        sourceCode = outputToUnicode(sourceBytes)
+        htmlCode = highlight(sourceCode, getLexer(srcPath, sourceCode), HtmlFormatter())
+        writeCacheFile(cachePath, htmlCode)
+    return '<!--pacers-highlight:%s-->'%key + htmlCode
+
+def getHighlightKeys(sourcesTable):
+    return re.findall(r'<!--pacers-highlight:([0-9a-f]+)-->', sourcesTable)
+
+# remove cache entries not used in the current report (and temporary files left by killed processes)
+def removeUnusedHighlightCache(cacheDir, usedHighlightKeys):
+    if not os.path.isdir(cacheDir):
+        return
+    for name in os.listdir(cacheDir):
+        if os.path.splitext(name)[0] not in usedHighlightKeys or not name.endswith('.html'):
+            try:
+                os.remove(opjoin(cacheDir, name))
+            except OSError:
+                pass
+
+# return None if cachePath does not exist
+def readCacheFile(cachePath):
+    try:
+        with codecs.open(cachePath, 'r', 'utf-8') as f:
+            return f.read()
+    except IOError:
+        return None
+
+def writeCacheFile(cachePath, htmlCode):
+    # write to a temporary file first, as other worker processes may write the same entry at the same time
+    try:
+        cacheDir = os.path.dirname(cachePath)
+        if not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError:
+                pass
+        tempPath = '%s.%d.tmp'%(cachePath, os.getpid())
+        with codecs.open(tempPath, 'w', 'utf-8') as f:
+            f.write(htmlCode)
+        os.rename(tempPath, cachePath)
+    except (IOError, OSError) as e:
+        print '%sCannot write cache file %s - %s'%(gLogPrefix, cachePath, e)
+
+############################################
+# row fragments
+# Rendered source tables and outputs of each row are stored in gRowFragmentDirName in the assignment
+# output dir, keyed by the fingerprint of their inputs. When the report is regenerated
+# (e.g. --run-only with new --user-input), only fragments whose inputs have changed are rendered again.
+# gRowFragmentVersion should be increased whenever the html rendered by getSourcesTable() or getOutput() changes.
+gRowFragmentVersion = 7
+
+def getRowFragmentDir(output_dir, assignment_alias):
+    return opjoin(opjoin(output_dir, unidecode(assignment_alias)), gRowFragmentDirName)
+
+def getFingerprint(values):
+    h = hashlib.sha1()
+    for value in values:
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif not isinstance(value, str):
+            value = repr(value)
+        h.update('%d:'%len(value))
+        h.update(value)
+    return h.hexdigest()
+
+# copied source files keep their sizes and modification times unless they are changed,
+# so they are fingerprinted without being read.
+def getSourcesTableFingerprint(srcPaths, destSrcPaths, assignment_dir, output_dir, assignment_alias):
+    values = [gRowFragmentVersion, pygments.__version__, sorted(gLexerAliases.items()),
+            gReportMaxSourceSize, gReportTruncatedSourceSize, assignment_dir, output_dir, assignment_alias]
+    for i in range(len(srcPaths)):
+        try:
+            st = os.stat(destSrcPaths[i])
+            stat = (st.st_size, st.st_mtime)
+        except OSError:
+            stat = None
+        values.extend([srcPaths[i], destSrcPaths[i], stat])
+    return getFingerprint(values)
+
+def getOutputFingerprint(buildRetCode, buildLog, userInputList, exitTypeList, stdoutStrList, testResultList):
+    values = [gRowFragmentVersion, gReportMaxOutputLength, gReportMaxRepeatedLines, buildRetCode, buildLog, userInputList, exitTypeList,
+            testResultList]
+    values.extend(stdoutStrList)
+    return getFingerprint(values)
+
+# return the html code of the fragment, which is rendered by renderFunc only if it has not been stored
+def getRowFragment(fragmentDir, fragmentName, renderFunc, renderArgs):
+    fragmentPath = opjoin(fragmentDir, fragmentName)
+    htmlCode = readCacheFile(fragmentPath)
+    if htmlCode==None:
+        htmlCode = renderFunc(*renderArgs)
+        writeCacheFile(fragmentPath, htmlCode)
+    return htmlCode
+
+# remove fragments not used in the current report
+def removeUnusedRowFragments(fragmentDir, usedFragmentNames):
+    if not os.path.isdir(fragmentDir):
+        return
+    for name in os.listdir(fragmentDir):
+        if name not in usedFragmentNames:
             try:
-                lexer = guess_lexer_for_filename(srcPath, sourceCode)
-            except pygments.util.ClassNotFound as e:
-                return False, 'No lexer found for:'
-            return True, highlight(sourceCode, lexer, HtmlFormatter())
-
-            # success, unistr = getUnicodeStr(sourceCode)
-            # if success:
-                # try:
-                    # lexer = guess_lexer_for_filename(srcPath, unistr)
-                # except pygments.util.ClassNotFound as e:
-                    # # return '<p></p>'+'<pre>'+format(e)+'</pre>'
-                    # return False, 'No lexer found for:'
-                # return True, highlight(unistr, lexer, HtmlFormatter())
-            # else:
-                # return False, '<p></p>'+'<pre>'+unistr+'</pre>'
-
-def getOutput(buildRetCode, buildLog, userInputList, exitTypeList, stdoutStrList):
-    s = '<pre>\n'
+                os.remove(opjoin(fragmentDir, name))
+            except OSError:
+                pass
+
+def getOutput(buildRetCode, buildLog, userInputList, exitTypeList, stdoutStrList, testResultList):
+    htmlCodes = ['<pre>\n']
     if buildRetCode!=0: # build error
-        s += buildLog
+        htmlCodes.append(renderOutputText(buildLog))
     else:
+        numTests, numPassedTests = getNumTests(testResultList)
+        if numTests > 0:
+            htmlCodes.append('Tests passed: %d/%d\n\n'%(numPassedTests, numTests))
         for i in range(len(userInputList)):
             userInput = userInputList[i]
             exitType = exitTypeList[i]
             stdoutStr = stdoutStrList[i]
+            testResult = testResultList[i]
+            if testResult!=None:
+                inputLabel = '(test case: %s)\n'%cgi.escape(toUnicode(testResult[0]))
+            else:
+                inputLabel = '(user input: %s)\n'%userInput
             if exitType == 0:
-                s += '(user input: %s)\n'%userInput
-                # success, unistr = getUnicodeStr(stdoutStr)
-                # s += highlight(unistr, TextLexer(), HtmlFormatter())
-                s += highlight(stdoutStr, TextLexer(), HtmlFormatter())
+                htmlCodes.append(inputLabel)
+                htmlCodes.append(getTestResultStr(testResult))
+                htmlCodes.append('<div class="highlight"><pre>%s</pre></div>'%renderOutputText(stdoutStr))
             elif exitType == -1:
-                s += highlight(stdoutStr, TextLexer(), HtmlFormatter())
+                htmlCodes.append('<div class="highlight"><pre>%s</pre></div>'%renderOutputText(stdoutStr))
             elif exitType == 1:   # time out
-                s += '(user input: %s)\n'%userInput
-                s += 'Timeout'
-            s += '\n'
-    return s
- 
+                htmlCodes.append(inputLabel)
+                htmlCodes.append(getTestResultStr(testResult))
+                htmlCodes.append('Timeout')
+            elif exitType == 2:   # skipped by the early-abort policy
+                htmlCodes.append(inputLabel)
+                htmlCodes.append(getTestResultStr(testResult))
+                htmlCodes.append('Skipped (after repeated timeouts or failures)')
+            htmlCodes.append('\n')
+    return ''.join(htmlCodes)
+
+def getEarlyAbortStr(args):
+    policies = []
+    if args.abort_after_failures > 0:
+        policies.append('after %d consecutive timeouts or failures'%args.abort_after_failures)
+    if args.timeout_after_timeout!=None:
+        policies.append('timeout %f after the first timeout'%args.timeout_after_timeout)
+    return ', '.join(policies) if len(policies) > 0 else 'none'
+
+# return the number of test cases with expected outputs, the number of passed test cases
+def getNumTests(testResultList):
+    checkedResults = [testResult for testResult in testResultList if testResult!=None and testResult[1]!=None]
+    return len(checkedResults), len([testResult for testResult in checkedResults if testResult[1]])
+
+def getTestResultStr(testResult):
+    if testResult==None or testResult[1]==None:
+        return ''
+    elif testResult[1]:
+        return '<b style="color:green">Passed</b>\n'
+    else:
+        return '<b style="color:red">Failed</b> - %s\n'%cgi.escape(testResult[2])
+
+# Program outputs are plain text, so they are just escaped instead of being highlighted by pygments.
+# Outputs longer than gReportMaxOutputLength characters are truncated, and a line repeated more than
+# gReportMaxRepeatedLines times in a row (e.g. printed in an infinite loop) is collapsed (0 means no collapsing).
+def renderOutputText(text):
+    numTruncatedChars = 0
+    if len(text) > gReportMaxOutputLength:
+        numTruncatedChars = len(text)-gReportMaxOutputLength
+        text = text[:gReportMaxOutputLength]
+
+    htmlCodes = []
+    if gReportMaxRepeatedLines > 0:
+        for line, lines in itertools.groupby(text.splitlines(True)):
+            numLines = sum(1 for _ in lines)
+            if numLines > gReportMaxRepeatedLines:
+                htmlCodes.append(cgi.escape(line))
+                htmlCodes.append('<i>(The line above is repeated %d more times.)</i>\n'%(numLines-1))
+            else:
+                htmlCodes.append(cgi.escape(line*numLines))
+    else:
+        htmlCodes.append(cgi.escape(text))
+
+    if not text.endswith('\n'):
+        htmlCodes.append('\n')
+    if numTruncatedChars > 0:
+        htmlCodes.append('<i>(%d more characters are truncated.)</i>\n'%numTruncatedChars)
+    return ''.join(htmlCodes)
+
 # def getUnicodeStr(str):
     # success = True
     # encodingStrs = ['utf-8', sys.getfilesystemencoding(), '(chardet)']
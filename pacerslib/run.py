@@ -16,23 +16,29 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import os, subprocess, threading, glob, re
+import os, subprocess, threading, glob, re, time
 from global_const import *
 from unicode import *
+from testcase import *
+from timing import *
+from schedule import *
 
-def runOneProj(projInfo, timeOut):
+def runOneProj(projInfo, timeOut, compareMode='exact', floatTolerance=0., timeOutClock='wall', abortAfterFailures=0, timeOutAfterTimeOut=None,
+        rawOutput=False):
     submissionType = projInfo['submissionType']
     projName = projInfo['projName']
     submissionDir = projInfo['submissionDir']
     filesInProj = projInfo['filesInProj']
     userInputs = projInfo['userInputs']
+    testCases = projInfo['testCases']
 
     exitTypeList = []
     stdoutStrList = []
     userInputList = userInputs
-    exitTypeList, stdoutStrList = runProj(submissionType, submissionDir, projName, filesInProj, userInputs, timeOut)
+    exitTypeList, stdoutStrList, testResultList = runProj(submissionType, submissionDir, projName, filesInProj, userInputs, timeOut,
+            testCases, compareMode, floatTolerance, timeOutClock, abortAfterFailures, timeOutAfterTimeOut, rawOutput)
 
-    return exitTypeList, stdoutStrList, userInputList
+    return exitTypeList, stdoutStrList, userInputList, testResultList
 
 ############################################
 # run functions
@@ -42,49 +48,94 @@ def runOneProj(projInfo, timeOut):
 #   -1 - execution failed due to internal error (not supported extension, not built yet)
 #   0 - normal exit
 #   1 - forced kill due to timeout
-
-def runProj(submissionType, submissionDir, projName, projSrcFileNames, userInputs, timeOut):
+#   2 - skipped by the early-abort policy
+# timeOutClock:
+#   wall - timeOut is measured in wall time
+#   cpu - timeOut is measured in cpu time of the target program (linux only), which is stable under load
+# early-abort policy:
+#   abortAfterFailures - the remaining inputs are skipped after this number of consecutive timeouts, failures
+#                        or crashes (killed by a signal, e.g. segmentation fault) of a project (0 means never)
+#   timeOutAfterTimeOut - None, or timeOut used for the remaining inputs after the first timeout of a project
+# rawOutput:
+#   False - output is decoded to a unicode string
+#   True - output is the byte string written by the target program (e.g. to be compared with other outputs)
+# testResult:
+#   None - not run with a test case
+#   [testCaseName, passed, diffSummary] - passed is None if the test case has no expected output
+
+def runProj(submissionType, submissionDir, projName, projSrcFileNames, userInputs, timeOut, testCases=None, compareMode='exact', floatTolerance=0., timeOutClock='wall',
+        abortAfterFailures=0, timeOutAfterTimeOut=None, rawOutput=False):
     exitTypeList = []
     stdoutStrList = []
-
-    for userInput in userInputs:
-
-        if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
-            exitType, stdoutStr = run_single_source(submissionDir, projName, projSrcFileNames[0], userInput, timeOut)
+    testResultList = []
+    numConsecutiveFailures = 0
+
+    for i in range(len(userInputs)):
+        userInput = userInputs[i]
+        testCase = testCases[i] if testCases!=None else None
+        checkOutput = None
+        if testCase!=None and testCase['expectedOutput']!=None:
+            checkOutput = lambda outputChunks, expectedOutput=testCase['expectedOutput']: \
+                    checkOutputStream(outputChunks, expectedOutput, compareMode, floatTolerance)
+
+        if abortAfterFailures > 0 and numConsecutiveFailures >= abortAfterFailures:
+            exitType, stdoutStr, checkResult, crashed = 2, u'', __getFailedTestResult(checkOutput, u'Skipped'), False
+        elif submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
+            exitType, stdoutStr, checkResult, crashed = run_single_source(submissionDir, projName, projSrcFileNames[0], userInput, timeOut, checkOutput,
+                    timeOutClock, rawOutput)
         elif submissionType==CMAKE_PROJECT:
-            exitType, stdoutStr = run_cmake(submissionDir, projName, userInput, timeOut)
+            exitType, stdoutStr, checkResult, crashed = run_cmake(submissionDir, projName, userInput, timeOut, checkOutput, timeOutClock, rawOutput)
         elif submissionType==VISUAL_CPP_PROJECT:
-            exitType, stdoutStr = run_vcxproj(submissionDir, projName, userInput, timeOut)
+            exitType, stdoutStr, checkResult, crashed = run_vcxproj(submissionDir, projName, userInput, timeOut, checkOutput, timeOutClock, rawOutput)
+
+        if exitType==1 or exitType==-1 or crashed:
+            numConsecutiveFailures += 1
+        elif exitType==0:
+            numConsecutiveFailures = 0
+        if exitType==1 and timeOutAfterTimeOut!=None:
+            timeOut = timeOutAfterTimeOut
 
         exitTypeList.append(exitType)
         stdoutStrList.append(stdoutStr)
+        if testCase==None:
+            testResultList.append(None)
+        elif checkResult==None:
+            testResultList.append([testCase['name'], None, u''])
+        else:
+            testResultList.append([testCase['name']]+checkResult)
 
-    return exitTypeList, stdoutStrList
+    return exitTypeList, stdoutStrList, testResultList
 
-def run_single_source(srcRootDir, projName, singleSrcFileName, userInput, timeOut):
+def run_single_source(srcRootDir, projName, singleSrcFileName, userInput, timeOut, checkOutput=None, timeOutClock='wall', rawOutput=False):
     extension = os.path.splitext(singleSrcFileName)[1].lower()
     if extension in gSourceExt:
         runcmd = eval(gSourceExt[extension]['runcmd-single-source-func'])(srcRootDir, projName)
         runcwd = eval(gSourceExt[extension]['runcwd-single-source-func'])(srcRootDir, projName)
-        return __run(runcmd, runcwd, userInput, timeOut)
+        return __run(runcmd, runcwd, userInput, timeOut, checkOutput, timeOutClock, rawOutput)
     else:
-        return run_single_else(extension)
+        return run_single_else(extension, checkOutput)
 
-def run_single_else(extension):
+def run_single_else(extension, checkOutput=None):
     errorMsg = 'Running %s is not supported.'%extension
-    return -1, errorMsg 
+    return -1, errorMsg, __getFailedTestResult(checkOutput, errorMsg), False
 
-def run_cmake(srcRootDir, projName, userInput, timeOut):
+def run_cmake(srcRootDir, projName, userInput, timeOut, checkOutput=None, timeOutClock='wall', rawOutput=False):
     runcmd = runcmd_cmake(srcRootDir, projName)
     runcwd = runcwd_single_c_cpp(srcRootDir, projName)
-    return __run(runcmd, runcwd, userInput, timeOut)
+    return __run(runcmd, runcwd, userInput, timeOut, checkOutput, timeOutClock, rawOutput)
 
-def run_vcxproj(srcRootDir, projName, userInput, timeOut):
+def run_vcxproj(srcRootDir, projName, userInput, timeOut, checkOutput=None, timeOutClock='wall', rawOutput=False):
     runcmd = runcmd_vcxproj(srcRootDir, projName)
     runcwd = runcwd_single_c_cpp(srcRootDir, projName)
-    return __run(runcmd, runcwd, userInput, timeOut)
-
-def __run(runcmd, runcwd, userInput, timeOut):
+    return __run(runcmd, runcwd, userInput, timeOut, checkOutput, timeOutClock, rawOutput)
+
+# return exitType, stdoutStr, checkResult, crashed
+# checkOutput - None, or a function that takes an iterable of output chunks and returns passed, diffSummary.
+# checkResult - None if checkOutput is None, or [passed, diffSummary]
+# crashed - True if the target program was killed by a signal not sent by PACERs (e.g. segmentation fault)
+# stdout of the target program is read chunk by chunk while being checked,
+# and the target program is killed at the first mismatch.
+def __run(runcmd, runcwd, userInput, timeOut, checkOutput=None, timeOutClock='wall', rawOutput=False):
     # append newline to finish stdin user input and flush input buffer
     realInput = userInput+'\n'
 
@@ -95,34 +146,106 @@ def __run(runcmd, runcwd, userInput, timeOut):
     # for i in range(len(userInput)):
         # realInput += userInput[i]+'\n'
 
+    # pin the target program to the dedicated cpu of this worker process (--pin-cpus)
+    preexecFunc = None
+    pinnedCpu = getPinnedCpu()
+    if pinnedCpu!=None:
+        preexecFunc = lambda: setCpuAffinity(0, [pinnedCpu])
+
     try:
-        proc = subprocess.Popen([toString(runcmd)], cwd=toString(runcwd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=False)
+        proc = subprocess.Popen([toString(runcmd)], cwd=toString(runcwd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=False,
+                preexec_fn=preexecFunc)
     except OSError:
         # return 2, runcmd
-        return -1, 'Cannot find %s (May has not been built yet).'%os.path.basename(runcmd)
+        errorMsg = 'Cannot find %s (May has not been built yet).'%os.path.basename(runcmd)
+        return -1, errorMsg, __getFailedTestResult(checkOutput, errorMsg), False
 
+    outputChunks = []
+    # outputStat - {'size':total bytes in outputChunks, 'overLimit':True if killed for writing too much output}
+    outputStat = {'size':0, 'overLimit':False}
     if timeOut != 0:
         # call onTimeOut() after timeOut seconds
-        timer = threading.Timer(timeOut, onTimeOut, [proc])
+        if timeOutClock=='cpu':
+            timerCanceled = threading.Event()
+            timer = threading.Thread(target=waitCpuTimeOut, args=(proc, timeOut, timerCanceled, outputStat))
+        else:
+            timerCanceled = None
+            timer = threading.Timer(timeOut, onTimeOut, [proc])
         timer.start()
 
-        # block until proc is finished
-        try:
-            stdoutStr, stderrStr = proc.communicate(realInput)
-            stdoutStr = toUnicode(stdoutStr)
-        except Exception as e:
-            return -1, toUnicode(str(type(e)) + ' ' + str(e))
+    # write stdin in another thread to avoid deadlock with a target program writing much output
+    inputThread = threading.Thread(target=writeInput, args=(proc, toString(realInput)))
+    inputThread.start()
 
+    # block until proc is finished
+    testResult = None
+    killedAtMismatch = False
+    try:
+        with profileSpan('execute', 'run', {'cmd':runcmd, 'input':userInput[:80]}):
+            if checkOutput!=None:
+                testResult = list(checkOutput(readOutputChunks(proc, outputChunks, outputStat)))
+                if proc.poll()==None:
+                    proc.kill()
+                    killedAtMismatch = True
+            # read the rest of output (if not killed)
+            for chunk in readOutputChunks(proc, outputChunks, outputStat):
+                pass
+            proc.wait()
+            inputThread.join()
+    except Exception as e:
+        # do not leave the target program, the timer and the input thread running
+        if timeOut != 0:
+            cancelTimeOut(timer, timerCanceled)
+        if proc.poll()==None:
+            proc.kill()
+        proc.wait()
+        inputThread.join()
+        errorMsg = toUnicode(str(type(e)) + ' ' + str(e))
+        return -1, errorMsg, __getFailedTestResult(checkOutput, errorMsg), False
+    if rawOutput:
+        stdoutStr = ''.join(outputChunks)
+    else:
+        with profileSpan('decode', 'run', {'cmd':runcmd}):
+            stdoutStr = outputToUnicode(''.join(outputChunks), runcmd)
+
+    if timeOut != 0:
         if timer.is_alive():    # if proc has finished without calling onTimeOut()
-            timer.cancel()
-            return 0, stdoutStr
+            cancelTimeOut(timer, timerCanceled)
         else:
-            return 1, stdoutStr # 1 means 'forced kill due to timeout'
-    else:
-        # block until proc is finished
-        stdoutStr, stderrStr = proc.communicate(realInput)
-        stdoutStr = toUnicode(stdoutStr)
-        return 0, stdoutStr
+            diffSummary = u'Output limit exceeded' if outputStat['overLimit'] else u'Timeout'
+            return 1, stdoutStr, __getFailedTestResult(checkOutput, diffSummary), False # 1 means 'forced kill due to timeout'
+    return 0, stdoutStr, testResult, not killedAtMismatch and isCrashReturnCode(proc.returncode)
+
+# negative return codes are signal numbers on posix, and crashes on windows have NTSTATUS error codes (e.g. 0xC0000005),
+# which python 2 on windows may return as negative numbers (e.g. -1073741819)
+def isCrashReturnCode(returnCode):
+    if os.name=='nt':
+        return returnCode < 0 or returnCode >= 0xC0000000
+    return returnCode < 0
+
+def __getFailedTestResult(checkOutput, diffSummary):
+    if checkOutput==None:
+        return None
+    return [False, toUnicode(diffSummary)]
+
+def writeInput(proc, realInput):
+    try:
+        proc.stdin.write(realInput)
+        proc.stdin.close()
+    except IOError:
+        # the target program exited (or was killed) without reading all input
+        pass
+
+# yield output chunks of proc until its stdout is closed, and append them to outputChunks
+# outputStat['size'] is updated as a running byte count, so that waitCpuTimeOut() does not re-sum the chunks
+def readOutputChunks(proc, outputChunks, outputStat):
+    while True:
+        chunk = os.read(proc.stdout.fileno(), 64*1024)
+        if chunk=='':
+            break
+        outputChunks.append(chunk)
+        outputStat['size'] += len(chunk)
+        yield chunk
 
 def runcmd_single_c_cpp(srcRootDir, projName):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
@@ -162,6 +285,40 @@ def runcmd_vcxproj(srcRootDir, projName):
 def onTimeOut(proc):
     proc.kill()
 
+# timerCanceled - None for a threading.Timer, or the event of a waitCpuTimeOut() thread
+def cancelTimeOut(timer, timerCanceled):
+    if timerCanceled!=None:
+        timerCanceled.set()
+    else:
+        timer.cancel()
+
+# call onTimeOut() after proc has used timeOut seconds of cpu time (or gCpuTimeOutWallFactor*timeOut seconds of wall time,
+# or has written more than gCpuTimeOutMaxOutputSize bytes, which sets outputStat['overLimit']), unless canceled is set.
+def waitCpuTimeOut(proc, timeOut, canceled, outputStat):
+    startTime = time.time()
+    while not canceled.wait(gCpuTimeOutPollInterval):
+        if outputStat['size'] > gCpuTimeOutMaxOutputSize:
+            outputStat['overLimit'] = True
+            onTimeOut(proc)
+            return
+        cpuTime = getCpuTime(proc.pid)
+        if (cpuTime!=None and cpuTime >= timeOut) or time.time()-startTime >= gCpuTimeOutWallFactor*timeOut:
+            onTimeOut(proc)
+            return
+
+# return user+system cpu time (seconds) of a process, or None if unknown
+def getCpuTime(pid):
+    try:
+        with open('/proc/%d/stat'%pid, 'r') as f:
+            # fields after the command name in parentheses (which may have spaces), from the 3rd field (state)
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11])+int(fields[12]))/float(os.sysconf('SC_CLK_TCK'))
+    except (IOError, IndexError, ValueError):
+        return None
+
+def isCpuTimeSupported():
+    return getCpuTime(os.getpid())!=None
+
 # def kill_windows(proc):
     # # http://stackoverflow.com/questions/4789837/how-to-terminate-a-python-subprocess-launched-with-shell-true
     # subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
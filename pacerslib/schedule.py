@@ -0,0 +1,243 @@
+################################################################################
+# schedule.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, time, json, platform, ctypes, ctypes.util, Queue
+import multiprocessing as mp
+from global_const import *
+from unicode import *
+
+############################################
+# job scheduling functions
+# Tasks are handed to the worker pool one by one, so that at most maxJobs tasks are running at a time
+# and, in the adaptive mode (--adaptive-jobs), a new task is started only if the system load is lower than
+# gAdaptiveJobsMaxLoadPerCore * (number of cpu cores) and the available memory is larger than
+# gAdaptiveJobsMinAvailableMemory. At least one task is always running, so all tasks are finished
+# even on a busy host.
+
+# yield results of func(params) for paramsList in order of completion, like pool.imap_unordered()
+# throttle - None, or a dict returned by startThrottle() for the adaptive mode
+def imapThrottled(pool, func, paramsList, maxJobs, throttle=None):
+    # apply_async() calls the callback only for successful tasks, so the callback just wakes up the loop
+    # and results (or exceptions) are taken from AsyncResult objects.
+    wakeUpQueue = Queue.Queue()
+    runningResults = []
+    numStarted = 0
+    while numStarted < len(paramsList) or len(runningResults) > 0:
+        heldReason = None
+        while numStarted < len(paramsList) and len(runningResults) < maxJobs:
+            if throttle!=None and len(runningResults) > 0:
+                heldReason = getThrottleReason()
+                if heldReason!=None:
+                    break
+            runningResults.append(pool.apply_async(func, (paramsList[numStarted],), callback=wakeUpQueue.put))
+            numStarted += 1
+
+        # wait for a finished task, or for the next check of the system load and memory (and failed tasks)
+        waitStartTime = time.time()
+        try:
+            wakeUpQueue.get(timeout=gJobPollInterval)
+        except Queue.Empty:
+            pass
+        if heldReason!=None:
+            throttle['heldTime'][heldReason] += time.time()-waitStartTime
+
+        for asyncResult in [asyncResult for asyncResult in runningResults if asyncResult.ready()]:
+            runningResults.remove(asyncResult)
+            yield asyncResult.get()
+
+def startThrottle(phase):
+    return {'phase':phase, 'heldTime':{'load':0., 'memory':0.}}
+
+def printThrottleSummary(throttle):
+    print '%sAdaptive jobs: New %s jobs were held back for %.1f sec by system load and %.1f sec by available memory.'%(
+            gLogPrefix, throttle['phase'], throttle['heldTime']['load'], throttle['heldTime']['memory'])
+
+# return 'load', 'memory' or None (a new job can be started)
+def getThrottleReason():
+    load = getSystemLoad()
+    if load!=None and load >= gAdaptiveJobsMaxLoadPerCore*mp.cpu_count():
+        return 'load'
+    availableMemory = getAvailableMemory()
+    if availableMemory!=None and availableMemory < gAdaptiveJobsMinAvailableMemory:
+        return 'memory'
+    return None
+
+# return the number of running processes (excluding this process), or None if unknown.
+# the number of currently runnable processes in /proc/loadavg is used on linux, as it reflects
+# the jobs started a moment ago, while the 1-minute load average lags behind.
+def getSystemLoad():
+    try:
+        with open('/proc/loadavg', 'r') as f:
+            # e.g. '0.50 0.40 0.30 3/456 12345' - 3 running (including this process) of 456
+            return int(f.read().split()[3].split('/')[0])-1
+    except (IOError, IndexError, ValueError):
+        pass
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+# return available memory in bytes, or None if unknown
+def getAvailableMemory():
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                # e.g. 'MemAvailable:    8041828 kB'
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])*1024
+    except (IOError, IndexError, ValueError):
+        pass
+    return None
+
+############################################
+# duration history functions for longest-processing-time-first ordering
+# Build and run durations of each project are saved in OUTPUT_DIR/pacers-durations-ASSIGNMENT_ALIAS.json,
+# and projects expected to take the longest are handed to the worker pool first in the next run,
+# so that a few slow projects started last do not leave a long tail.
+# Durations of projects not in the history (e.g. new submissions) are estimated from the total size of their files
+# by the seconds per byte of the projects in the history.
+
+# durationHistory: {'build':{projKey:seconds}, 'run':{projKey:seconds}}
+def loadDurationHistory(filePath):
+    durationHistory = {'build':{}, 'run':{}}
+    try:
+        with open(toString(filePath), 'r') as f:
+            loaded = json.load(f)
+        for phase in durationHistory:
+            durationHistory[phase].update(loaded.get(phase, {}))
+    except (IOError, ValueError, AttributeError):
+        pass
+    return durationHistory
+
+def saveDurationHistory(filePath, durationHistory):
+    with open(toString(filePath), 'w') as f:
+        json.dump(durationHistory, f, indent=0, sort_keys=True)
+
+def getDurationHistoryFilePath(output_dir, decodeAlias):
+    return opjoin(output_dir, 'pacers-durations-%s.json'%decodeAlias)
+
+def getProjKey(projInfo):
+    return projInfo['submissionTitle']+u'/'+projInfo['projName']
+
+# return indices of allProjInfos in descending order of their expected durations
+# durations: {projKey:seconds} of a phase in durationHistory
+def getLongestFirstOrder(allProjInfos, durations):
+    projKeys = [getProjKey(projInfo) for projInfo in allProjInfos]
+    knownIndices = [i for i in range(len(allProjInfos)) if projKeys[i] in durations]
+    expectedDurations = [durations.get(projKey) for projKey in projKeys]
+
+    # files are sized only if some projects are not in the history
+    if len(knownIndices) < len(allProjInfos):
+        secPerByte = 1.
+        knownSize = sum(getProjSize(allProjInfos[i]) for i in knownIndices)
+        if knownSize > 0:
+            secPerByte = sum(durations[projKeys[i]] for i in knownIndices)/float(knownSize)
+        for i in range(len(allProjInfos)):
+            if expectedDurations[i]==None:
+                expectedDurations[i] = getProjSize(allProjInfos[i])*secPerByte
+
+    # sorted() is stable, so projects with the same expected durations keep their order
+    return sorted(range(len(allProjInfos)), key=lambda i: -expectedDurations[i])
+
+# total size of files in a project in bytes
+def getProjSize(projInfo):
+    size = 0
+    for fileName in projInfo['filesInProj']:
+        try:
+            size += os.path.getsize(toString(opjoin(projInfo['submissionDir'], fileName)))
+        except OSError:
+            pass
+    return size
+
+############################################
+# cpu pinning functions for --pin-cpus (linux only)
+# gPinReservedCpus cpus are reserved for PACERs itself (the main process and worker processes, which mostly
+# wait for target programs), and each worker process of the run phase has its own dedicated cpu.
+# Target programs are pinned to the dedicated cpu of the worker process running them, so that parallel
+# target programs do not perturb each other.
+# sched_setaffinity() is not in the os module of python 2, so it is called from libc by ctypes.
+gPinnedCpu = None
+gLibc = None
+
+# return pinning, or None if cpus cannot be pinned
+# pinning: {'origCpus':cpus allowed before pinning, 'reservedCpus':[...], 'runCpus':dedicated cpus of run jobs}
+def startCpuPinning(numJobs):
+    allowedCpus = getCpuAffinity(0)
+    if allowedCpus==None:
+        print '%sCannot pin cpus on this platform. Programs are run without pinning.'%gLogPrefix
+        return None
+    if len(allowedCpus) <= gPinReservedCpus:
+        print '%sCannot pin cpus, as only %d cpus are available and %d cpus are reserved for PACERs. Programs are run without pinning.'%(
+                gLogPrefix, len(allowedCpus), gPinReservedCpus)
+        return None
+    pinning = {'origCpus':allowedCpus, 'reservedCpus':allowedCpus[:gPinReservedCpus],
+               'runCpus':allowedCpus[gPinReservedCpus:gPinReservedCpus+numJobs]}
+    # worker processes created after this inherit the reserved cpus
+    setCpuAffinity(0, pinning['reservedCpus'])
+    return pinning
+
+def finishCpuPinning(pinning):
+    setCpuAffinity(0, pinning['origCpus'])
+    setPinnedCpu(None)
+
+# initializer of worker processes of the run phase
+def initPinnedRunWorker(cpuQueue):
+    setPinnedCpu(cpuQueue.get())
+
+def setPinnedCpu(cpu):
+    global gPinnedCpu
+    gPinnedCpu = cpu
+
+# return the dedicated cpu of this process for target programs, or None
+def getPinnedCpu():
+    return gPinnedCpu
+
+# return a sorted list of cpus allowed for pid (0 for this process), or None if not supported
+def getCpuAffinity(pid):
+    libc = __getLibc()
+    if libc==None:
+        return None
+    cpuSet = __newCpuSet()
+    if libc.sched_getaffinity(pid, ctypes.sizeof(cpuSet), cpuSet)!=0:
+        return None
+    bitsPerWord = 8*ctypes.sizeof(ctypes.c_ulong)
+    return [cpu for cpu in range(gCpuSetSize) if cpuSet[cpu/bitsPerWord] & (1 << (cpu%bitsPerWord))]
+
+# return True if succeeded
+def setCpuAffinity(pid, cpus):
+    libc = __getLibc()
+    if libc==None:
+        return False
+    cpuSet = __newCpuSet()
+    bitsPerWord = 8*ctypes.sizeof(ctypes.c_ulong)
+    for cpu in cpus:
+        cpuSet[cpu/bitsPerWord] |= 1 << (cpu%bitsPerWord)
+    return libc.sched_setaffinity(pid, ctypes.sizeof(cpuSet), cpuSet)==0
+
+# cpu_set_t of glibc
+def __newCpuSet():
+    return (ctypes.c_ulong*(gCpuSetSize/(8*ctypes.sizeof(ctypes.c_ulong))))()
+
+def __getLibc():
+    global gLibc
+    if gLibc==None and platform.system()=='Linux':
+        try:
+            gLibc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        except OSError:
+            pass
+    return gLibc
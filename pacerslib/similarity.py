@@ -0,0 +1,158 @@
+################################################################################
+# similarity.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, itertools, collections, zlib
+import multiprocessing as mp
+from pygments.token import Comment, Text, Name, String, Number
+from global_const import *
+from unicode import *
+from report import *
+
+############################################
+# source similarity functions
+# Sources of each project are tokenized by the pygments lexers used for the report, and identifiers and
+# literals are normalized so that renaming variables does not hide copied code.
+# Each project is represented by winnowing fingerprints (selected hashes of token k-grams), and an inverted
+# index from fingerprints to projects gives candidate pairs without comparing all pairs of projects.
+# Fingerprints shared by too many projects (e.g. skeleton code given to all students) are ignored.
+# The number of projects kept for a fingerprint has an absolute cap (gSimilarityMaxCommonFingerprintProjs),
+# which bounds the number of pairs counted for each fingerprint, so the time is linear in the total number of fingerprints
+# (and so in the number of projects of similar sizes).
+
+# return similarPairs sorted by similarity
+# similarPairs: [[projIndex1, projIndex2, label1, label2, similarity, numSharedFingerprints], ...]
+#   similarity - numSharedFingerprints / (number of not ignored fingerprints of the smaller project)
+def getSimilarPairs(allProjInfos, num_cores, serial=False):
+    fingerprintParams = [(projInfo['submissionDir'], projInfo['filesInProj']) for projInfo in allProjInfos]
+    if not serial:
+        p = mp.Pool(num_cores)
+        fingerprintSets = p.map(worker_fingerprint, fingerprintParams)
+        p.close()
+        p.join()
+    else:
+        fingerprintSets = map(worker_fingerprint, fingerprintParams)
+
+    # inverted index
+    # fingerprint -> indices of projects that have the fingerprint
+    projIndicesOfFingerprint = collections.defaultdict(list)
+    for i in range(len(fingerprintSets)):
+        for fingerprint in fingerprintSets[i]:
+            projIndicesOfFingerprint[fingerprint].append(i)
+
+    maxProjsPerFingerprint = min(gSimilarityMaxCommonFingerprintProjs,
+            max(gSimilarityMinCommonFingerprintProjs, int(len(allProjInfos)*gSimilarityCommonFingerprintRatio)))
+
+    # count shared fingerprints of each candidate pair
+    # projects in the same submission are not compared.
+    numFingerprints = [0]*len(allProjInfos)
+    numSharedFingerprints = collections.defaultdict(int)
+    for projIndices in projIndicesOfFingerprint.itervalues():
+        if len(projIndices) > maxProjsPerFingerprint:
+            continue
+        for i in projIndices:
+            numFingerprints[i] += 1
+        for i, j in itertools.combinations(projIndices, 2):
+            if allProjInfos[i]['submissionIndex']!=allProjInfos[j]['submissionIndex']:
+                numSharedFingerprints[(i, j)] += 1
+
+    similarPairs = []
+    for (i, j), numShared in numSharedFingerprints.iteritems():
+        similarity = float(numShared)/min(numFingerprints[i], numFingerprints[j])
+        if similarity >= gSimilarityMinSimilarity and numShared >= gSimilarityMinSharedFingerprints:
+            similarPairs.append([i, j, getSimilarityLabel(allProjInfos[i]), getSimilarityLabel(allProjInfos[j]), similarity, numShared])
+    similarPairs.sort(key=lambda pair: (-pair[4], -pair[5], pair[0], pair[1]))
+    return similarPairs[:gSimilarityMaxPairs]
+
+def getSimilarityLabel(projInfo):
+    if projInfo['numProjInSubmission'] > 1:
+        return u'%s / %s'%(projInfo['submissionTitle'], projInfo['projName'])
+    return projInfo['submissionTitle']
+
+############################################
+# multi processing worker functions
+def worker_fingerprint(params):
+    submissionDir, filesInProj = params
+    fingerprints = set()
+    for fileName in filesInProj:
+        tokens = getNormalizedTokens(opjoin(submissionDir, fileName))
+        fingerprints.update(getWinnowingFingerprints(tokens, gSimilarityKgramSize, gSimilarityWindowSize))
+    return fingerprints
+
+############################################
+# fingerprint functions
+
+# return normalized tokens of a source file, or [] for non-source (or binary, too large) files
+def getNormalizedTokens(srcPath):
+    fileName = os.path.basename(srcPath)
+    ext = os.path.splitext(fileName)[1].lower()
+    alias = gLexerAliases.get(fileName, gLexerAliases.get(ext))
+    if alias not in gSimilarityLexers:
+        return []
+
+    try:
+        with open(srcPath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > gReportMaxSourceSize:
+                return []
+            sourceBytes = f.read()
+    except IOError:
+        return []
+    if isBinaryBlock(sourceBytes[:gReportBinarySniffSize]):
+        return []
+
+    sourceCode = toUnicode(sourceBytes)
+    tokens = []
+    for tokenType, value in getLexer(srcPath, sourceCode).get_tokens(sourceCode):
+        if tokenType in Comment.Preproc:
+            value = value.strip()
+        elif tokenType in Comment or tokenType in Text:
+            continue
+        elif tokenType in Name:
+            value = u'N'
+        elif tokenType in String:
+            # a string literal is lexed as multiple tokens (quotes, contents, escapes)
+            if len(tokens) > 0 and tokens[-1]==u'S':
+                continue
+            value = u'S'
+        elif tokenType in Number:
+            value = u'0'
+        else:
+            value = value.strip()
+        if value!=u'':
+            tokens.append(value)
+    return tokens
+
+# return a set of fingerprints selected from hashes of k-grams of tokens by winnowing.
+# the minimum hash (the rightmost one for ties) in each window of windowSize consecutive hashes is selected,
+# so any common substring of at least windowSize+kgramSize-1 tokens shares at least one fingerprint.
+def getWinnowingFingerprints(tokens, kgramSize, windowSize):
+    tokenHashes = [zlib.crc32(token.encode('utf-8')) for token in tokens]
+    kgramHashes = [hash(tuple(tokenHashes[i:i+kgramSize])) for i in range(len(tokenHashes)-kgramSize+1)]
+    if len(kgramHashes) < windowSize:
+        return set([min(kgramHashes)]) if len(kgramHashes) > 0 else set()
+
+    fingerprints = set()
+    window = collections.deque()     # indices of kgramHashes in increasing order of their hashes
+    for i in range(len(kgramHashes)):
+        while len(window) > 0 and kgramHashes[window[-1]] >= kgramHashes[i]:
+            window.pop()
+        window.append(i)
+        if window[0] <= i-windowSize:
+            window.popleft()
+        if i >= windowSize-1:
+            fingerprints.add(kgramHashes[window[0]])
+    return fingerprints
@@ -0,0 +1,159 @@
+################################################################################
+# testcase.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, re
+from global_const import *
+from unicode import *
+
+############################################
+# test case functions
+# A test case directory has NAME.in (user input) and NAME.out (expected output) files for each test case.
+# NAME.in without NAME.out is a test case only for showing its output.
+# return a list of testCases sorted by name.
+# testCase:
+#   {'name':NAME, 'input':content of NAME.in, 'expectedOutput':content of NAME.out or None}
+def loadTestCases(testCaseDir):
+    testCases = []
+    for fileName in sorted(os.listdir(testCaseDir)):
+        name, ext = os.path.splitext(fileName)
+        if ext!='.in':
+            continue
+
+        testCase = {}
+        testCase['name'] = name
+        with open(opjoin(testCaseDir, fileName), 'rb') as f:
+            testCase['input'] = f.read()
+        try:
+            with open(opjoin(testCaseDir, name+'.out'), 'rb') as f:
+                testCase['expectedOutput'] = f.read()
+        except IOError:
+            testCase['expectedOutput'] = None
+        testCases.append(testCase)
+    return testCases
+
+############################################
+# output check functions
+# Outputs are compared as byte strings while they are being read from the target program,
+# and the comparison stops at the first mismatch.
+# compareMode:
+#   exact - each line should be the same (line endings are ignored)
+#   whitespace - whitespace-separated tokens should be the same
+#   float - same as whitespace, but numeric tokens are equal within floatTolerance
+#           (absolute, or relative to the expected value if it is larger than 1)
+gCompareModes = ['exact', 'whitespace', 'float']
+
+# outputChunks - iterable of byte strings of the output
+# return passed, diffSummary
+def checkOutputStream(outputChunks, expectedOutput, compareMode, floatTolerance):
+    if compareMode=='exact':
+        expectedLines = expectedOutput.splitlines()
+        # +1 for '\r' of a CRLF line ending
+        return __compareSequences(iterLines(outputChunks, getMaxLength(expectedLines)+1), expectedLines, 'Line',
+                lambda expected, actual: expected==actual)
+    elif compareMode=='whitespace':
+        expectedTokens = expectedOutput.split()
+        return __compareSequences(iterTokens(outputChunks, getMaxLength(expectedTokens)), expectedTokens, 'Token',
+                lambda expected, actual: expected==actual)
+    elif compareMode=='float':
+        expectedTokens = expectedOutput.split()
+        return __compareSequences(iterTokens(outputChunks, max(getMaxLength(expectedTokens), gFloatTokenMaxLength)), expectedTokens, 'Token',
+                lambda expected, actual: isTokenEqualWithTolerance(expected, actual, floatTolerance))
+    else:
+        raise NotImplementedError
+
+def getMaxLength(strings):
+    return max([0]+[len(string) for string in strings])
+
+def __compareSequences(actualItems, expectedItems, itemName, isEqual):
+    count = 0
+    for actual in actualItems:
+        if count >= len(expectedItems):
+            return False, u'%s %d: expected end of output, but got "%s"'%(itemName, count+1, getShortStr(actual))
+        if not isEqual(expectedItems[count], actual):
+            return False, u'%s %d: expected "%s", but got "%s"'%(itemName, count+1, getShortStr(expectedItems[count]), getShortStr(actual))
+        count += 1
+    if count < len(expectedItems):
+        return False, u'%s %d: expected "%s", but got end of output'%(itemName, count+1, getShortStr(expectedItems[count]))
+    return True, u''
+
+def isTokenEqualWithTolerance(expected, actual, floatTolerance):
+    if expected==actual:
+        return True
+    try:
+        expectedValue = float(expected)
+        actualValue = float(actual)
+    except ValueError:
+        return False
+    return abs(expectedValue-actualValue) <= floatTolerance*max(1., abs(expectedValue))
+
+def getShortStr(string, maxLen=80):
+    string = toUnicode(string)
+    if len(string) > maxLen:
+        return string[:maxLen]+u'...'
+    return string
+
+# Chunks of an unfinished line (or token) are kept in a list and joined only when its end arrives,
+# so output without line endings is not copied again for each chunk.
+# If an unfinished line (or token) gets longer than maxLength, it cannot match any expected one, so it is
+# yielded at once with '...' appended (which also makes it mismatch in float comparison), and no more items are yielded.
+
+# yield lines without line endings from byte string chunks
+def iterLines(chunks, maxLength=None):
+    pending = []
+    pendingLength = 0
+    for chunk in chunks:
+        if '\n' in chunk:
+            lines = (''.join(pending)+chunk).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line.rstrip('\r')
+            pending = [rest]
+            pendingLength = len(rest)
+        else:
+            pending.append(chunk)
+            pendingLength += len(chunk)
+        if maxLength!=None and pendingLength > maxLength:
+            yield ''.join(pending)+'...'
+            return
+    rest = ''.join(pending)
+    if rest!='':
+        yield rest.rstrip('\r')
+
+# yield whitespace-separated tokens from byte string chunks
+def iterTokens(chunks, maxLength=None):
+    pending = []
+    pendingLength = 0
+    for chunk in chunks:
+        if re.search(r'\s', chunk)!=None:
+            tokens = re.split(r'\s+', ''.join(pending)+chunk)
+            # the last token may continue in the next chunk
+            rest = tokens.pop()
+            for token in tokens:
+                if token!='':
+                    yield token
+            pending = [rest]
+            pendingLength = len(rest)
+        else:
+            pending.append(chunk)
+            pendingLength += len(chunk)
+        if maxLength!=None and pendingLength > maxLength:
+            yield ''.join(pending)+'...'
+            return
+    rest = ''.join(pending)
+    if rest!='':
+        yield rest
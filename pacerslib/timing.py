@@ -0,0 +1,106 @@
+################################################################################
+# timing.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, time, json, shutil, contextlib
+from global_const import *
+from unicode import *
+
+############################################
+# profile functions for --profile
+# Each process (including worker processes) appends its spans to its own file in the profile dir,
+# which is passed to worker processes by the gProfileDirEnvName environment variable
+# (module globals are not inherited by worker processes on Windows).
+# span:
+#   {'name':name, 'cat':category, 'ts':start time (sec), 'dur':duration (sec), 'pid':process id, 'args':{...}}
+
+def startProfile(profileDir):
+    if os.path.exists(profileDir):
+        shutil.rmtree(profileDir)
+    os.makedirs(profileDir)
+    os.environ[gProfileDirEnvName] = profileDir
+
+def stopProfile():
+    profileDir = os.environ.pop(gProfileDirEnvName)
+    spans = loadProfileSpans(profileDir)
+    shutil.rmtree(profileDir)
+    return spans
+
+def isProfileEnabled():
+    return gProfileDirEnvName in os.environ
+
+# with profileSpan('compile', 'build', {'dir':buildDir}):
+#     ...
+@contextlib.contextmanager
+def profileSpan(name, category, args=None):
+    if not isProfileEnabled():
+        yield
+        return
+    startTime = time.time()
+    try:
+        yield
+    finally:
+        recordProfileSpan(name, category, startTime, args)
+
+# record a span from startTime (returned by time.time()) to now
+def recordProfileSpan(name, category, startTime, args=None):
+    if not isProfileEnabled():
+        return
+    span = {'name':name, 'cat':category, 'ts':startTime, 'dur':time.time()-startTime, 'pid':os.getpid(), 'args':{}}
+    if args!=None:
+        for key in args:
+            span['args'][key] = toUnicode(args[key]) if isinstance(args[key], str) else args[key]
+    spanFilePath = os.path.join(os.environ[gProfileDirEnvName], 'spans-%d.jsonl'%os.getpid())
+    with open(spanFilePath, 'a') as f:
+        f.write(json.dumps(span)+'\n')
+
+def loadProfileSpans(profileDir):
+    spans = []
+    for fileName in os.listdir(profileDir):
+        with open(os.path.join(profileDir, fileName), 'r') as f:
+            for line in f:
+                spans.append(json.loads(line))
+    spans.sort(key=lambda span: span['ts'])
+    return spans
+
+# write spans as a Chrome trace event file, which can be loaded in chrome://tracing or https://ui.perfetto.dev
+def writeChromeTrace(spans, traceFilePath):
+    events = []
+    for span in spans:
+        events.append({'name':span['name'], 'cat':span['cat'], 'ph':'X', 'ts':int(span['ts']*1e6), 'dur':int(span['dur']*1e6),
+            'pid':span['pid'], 'tid':span['pid'], 'args':span['args']})
+    with open(traceFilePath, 'w') as f:
+        json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, f)
+
+def printProfileSummary(spans, numTopSpans):
+    print '%sProfile summary (seconds):'%gLogPrefix
+    print
+    print '%-16s %-10s %8s %10s %10s %10s'%('Span', 'Category', 'Count', 'Total', 'Mean', 'Max')
+    spansOfName = {}
+    for span in spans:
+        spansOfName.setdefault((span['name'], span['cat']), []).append(span)
+    for (name, category), namedSpans in sorted(spansOfName.items(), key=lambda item: -sum(span['dur'] for span in item[1])):
+        durs = [span['dur'] for span in namedSpans]
+        print toString(u'%-16s %-10s %8d %10.3f %10.3f %10.3f'%(name, category, len(durs), sum(durs), sum(durs)/len(durs), max(durs)))
+
+    print
+    print '%sTop %d spans except phases:'%(gLogPrefix, numTopSpans)
+    print
+    topSpans = sorted([span for span in spans if span['cat']!='phase'], key=lambda span: -span['dur'])[:numTopSpans]
+    for span in topSpans:
+        argsStr = u', '.join(u'%s: %s'%(key, span['args'][key]) for key in sorted(span['args']))
+        print toString(u'%10.3f  %-16s pid %-7d %s'%(span['dur'], span['name'], span['pid'], argsStr))
@@ -16,15 +16,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import os, sys, chardet
+import os, sys, chardet, collections, codecs
 from unidecode import unidecode
 
 ############################################
 # unicode functions
 def opjoin(a, b):
     if os.name=='posix':
-        # Convert paths for os.path.join to byte string only for posix os (due to python bug?)
-        return toUnicode(os.path.join(toString(a), toString(b)))
+        # os.path.join fails when byte strings and unicode strings are mixed (python bug?),
+        # so decode each part first instead of encoding both parts and decoding the joined path.
+        return os.path.join(toUnicode(a), toUnicode(b))
     else:
         return os.path.join(a, b)
 
@@ -36,20 +37,97 @@ def toString(unistr):
 def toUnicode(string):
     if isinstance(string, unicode):
         return string
+
+    # ascii fast path - ascii byte strings decode the same in every filesystem encoding
+    try:
+        return string.decode('ascii')
+    except UnicodeDecodeError:
+        pass
+
+    # long byte strings (program outputs, build logs) are not memoized
+    if len(string) > gDecodeMemoMaxLen:
+        return __decodeString(string)
+
     try:
-        retstr = unicode(string, sys.getfilesystemencoding())
+        retstr = gDecodeMemo.pop(string)
+    except KeyError:
+        retstr = __decodeString(string)
+        if len(gDecodeMemo) >= gDecodeMemoSize:
+            gDecodeMemo.popitem(last=False)
+    gDecodeMemo[string] = retstr
+    return retstr
+
+############################################
+# path codec memo
+# The same file and directory names are decoded again and again while walking submissions,
+# so decoded names are kept in a bounded LRU map (most recently used item is the last one).
+gDecodeMemoSize = 4096
+gDecodeMemoMaxLen = 4096
+gDecodeMemo = collections.OrderedDict()
+
+def __decodeString(string):
+    try:
+        return unicode(string, sys.getfilesystemencoding())
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        detectedEncoding = chardet.detect(string)['encoding']
+        if detectedEncoding!=None:
+            return unicode(string, detectedEncoding)
+        else:
+            return u'chardet fails to detect encoding'
     except UnicodeDecodeError as e:
-        try:
-            detectedEncoding = chardet.detect(string)['encoding']
-            if detectedEncoding!=None:
-                retstr = unicode(string, chardet.detect(string)['encoding'])
-            else:
-                retstr = 'chardet fails to detect encoding'
-        except UnicodeDecodeError as e:
-            return toUnicode(str(e))
-        return retstr
+        return toUnicode(str(e))
+
+############################################
+# program output decoding
+# Program outputs and build logs can be several MB of garbage, so their encoding is detected
+# from a bounded sample and decoded incrementally with the replacement error handler.
+# Source files rendered in the report are decoded in the same way.
+# Detected encodings are cached per cacheKey (e.g. executable path), as a program usually
+# prints in the same encoding for every user input.
+gOutputSampleSize = 16*1024
+gOutputChunkSize = 256*1024
+gOutputEncodingCache = {}
+
+def outputToUnicode(string, cacheKey=None):
+    if isinstance(string, unicode):
+        return string
+
+    # ascii fast path
+    try:
+        return string.decode('ascii')
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        return unicode(string, sys.getfilesystemencoding())
+    except UnicodeDecodeError:
+        pass
+
+    decoder = getOutputDecoder(string[:gOutputSampleSize], cacheKey)
+    chunks = []
+    for i in range(0, len(string), gOutputChunkSize):
+        chunks.append(decoder.decode(string[i:i+gOutputChunkSize]))
+    chunks.append(decoder.decode('', final=True))
+    return u''.join(chunks)
+
+# return an incremental decoder for the encoding detected from sample
+def getOutputDecoder(sample, cacheKey=None):
+    if cacheKey!=None and cacheKey in gOutputEncodingCache:
+        encoding = gOutputEncodingCache[cacheKey]
     else:
-        return retstr
+        encoding = chardet.detect(sample)['encoding']
+        if encoding==None:
+            encoding = sys.getfilesystemencoding()
+        if cacheKey!=None:
+            gOutputEncodingCache[cacheKey] = encoding
+
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder(sys.getfilesystemencoding())(errors='replace')
 
 ############################################
 # unidecode functions
@@ -63,12 +141,15 @@ def unico2decoPath(unicoPath, deco2unicoMap):
             name, ext = os.path.splitext(unicoToken)
             unicoToken = name
 
-        decoToken = unidecode(unicoToken)
-        decoToken = decoToken.replace(' ', '_')
-        decoToken = decoToken.replace('(', '_')
-        decoToken = decoToken.replace(')', '_')
-        if decoToken not in deco2unicoMap:
-            deco2unicoMap[decoToken] = unicoToken
+        decoToken = getDecoToken(unicoToken)
+
+        # if another unicode token has been already decoded to the same token, add a numbered suffix
+        baseDecoToken = decoToken
+        count = 1
+        while decoToken in deco2unicoMap and deco2unicoMap[decoToken]!=unicoToken:
+            count += 1
+            decoToken = '%s_%d'%(baseDecoToken, count)
+        deco2unicoMap[decoToken] = unicoToken
 
         if hasExt:
             decoToken += ext
@@ -78,6 +159,13 @@ def unico2decoPath(unicoPath, deco2unicoMap):
     decoPath = reduce(os.path.join, decoTokens)
     return decoPath
 
+def getDecoToken(unicoToken):
+    decoToken = unidecode(unicoToken)
+    decoToken = decoToken.replace(' ', '_')
+    decoToken = decoToken.replace('(', '_')
+    decoToken = decoToken.replace(')', '_')
+    return decoToken
+
 def deco2unicoPath(decoPath, deco2unicoMap):
     decoTokens = os.path.normpath(decoPath).split(os.sep)
 